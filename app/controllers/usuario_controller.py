@@ -1,22 +1,44 @@
+from sqlalchemy import Float, Integer, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+import base64
+import json
+import re
 import secrets
 import string
 
 from ..models.usuario import User, UserRole
+from ..models.projections import WITH_CONFIRMATION, WITH_CREDENTIALS, project
 from ..schemas.usuario_schema import (
     UserCreate,
     UserLogin,
     PasswordUpdate,
     EmailConfirmation,
     ResendConfirmation,
+    BulkUserSelection,
+    UserListItem,
+    UserResponse,
 )
 from ..utils.security import (
     create_access_token,
+    verify_token,
 )
+from ..utils.tracing import traced
 from ..services.email_service import EmailService
+from ..services.stats_service import user_stats
+from ..services.activity_service import activity_tracker
+
+# Tamaño de lote para operaciones masivas (UPDATE/DELETE ... WHERE id IN)
+BULK_CHUNK_SIZE = 500
+
+# Límites de la búsqueda de usuarios (coste acotado por consulta)
+SEARCH_MAX_TOKENS = 5
+SEARCH_MAX_CANDIDATES = 1000  # Filas máximas por rama del índice
+SEARCH_EMAIL_SCORE = 2.0  # Peso de una coincidencia por prefijo de email
 
 
 class AuthController:
@@ -29,18 +51,9 @@ class AuthController:
         characters = string.ascii_uppercase + string.digits
         return ''.join(secrets.choice(characters) for _ in range(length))
 
-    def create_user(self, user_data: UserCreate) -> User:
-        """Crear un nuevo usuario y enviar email de confirmación"""
-
-        # Verificar si el email ya existe
-        existing_email = (
-            self.db.query(User).filter(User.email == user_data.email).first()
-        )
-        if existing_email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El email ya está registrado",
-            )
+    @traced()
+    def create_user(self, user_data: UserCreate, send_email: bool = True) -> User:
+        """Crear un nuevo usuario y (si send_email) enviar email de confirmación"""
 
         # Crear nuevo usuario sin confirmar
         db_user = User(
@@ -54,29 +67,52 @@ class AuthController:
         # Hashear contraseña usando el método del modelo
         db_user.set_password(user_data.password)
 
+        # El token se guarda en el mismo INSERT
+        self._assign_confirmation_token(db_user)
+
+        # Un solo INSERT: el índice único de email detecta los duplicados
         self.db.add(db_user)
-        self.db.commit()
-        self.db.refresh(db_user)
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El email ya está registrado",
+            )
+        user_stats.record_created(db_user)
+
+        if send_email:
+            self.send_registration_email(db_user)
+        return db_user
 
-        # Enviar email de confirmación
+    @traced()
+    def send_registration_email(self, user: User) -> None:
+        """Enviar el email de confirmación de un usuario recién creado"""
         try:
-            self.send_confirmation_email(db_user)
+            self.email_service.send_confirmation_email(
+                user.email, f"{user.name} {user.last_name}", user.confirmation_token
+            )
         except Exception as e:
             print(f"Error enviando email de confirmación: {e}")
             # No fallar el registro si el email falla
             pass
 
-        return db_user
-
-    def send_confirmation_email(self, user: User) -> bool:
-        """Enviar email de confirmación"""
+    def _assign_confirmation_token(self, user: User) -> str:
+        """Generar un token de confirmación y asignarlo al usuario (sin commit)"""
         # Generar token de confirmación alfanumérico
         confirmation_token = self.generate_confirmation_token(6)  # Token de 6 dígitos
 
-        # Guardar token en la base de datos (necesitarás agregar estos campos al modelo)
+        now = datetime.utcnow()
         user.confirmation_token = confirmation_token
-        user.confirmation_sent_at = datetime.utcnow()
-        user.token_expires_at = datetime.utcnow() + timedelta(hours=24)  # Expira en 24 horas
+        user.confirmation_sent_at = now
+        user.token_expires_at = now + timedelta(hours=24)  # Expira en 24 horas
+        return confirmation_token
+
+    @traced()
+    def send_confirmation_email(self, user: User) -> bool:
+        """Enviar email de confirmación"""
+        confirmation_token = self._assign_confirmation_token(user)
         self.db.commit()
 
         # Enviar email
@@ -84,15 +120,93 @@ class AuthController:
             user.email, f"{user.name} {user.last_name}", confirmation_token
         )
 
+    def _confirm_values(self) -> dict:
+        return {
+            "email_confirmed": True,
+            "confirmation_token": None,
+            "token_expires_at": None,
+            "confirmation_sent_at": None,
+        }
+
+    @traced()
     def confirm_email(self, confirmation_data: EmailConfirmation) -> User:
-        """Confirmar email del usuario"""
-        
+        """Confirmar email del usuario.
+
+        Con RETURNING (SQLite, PostgreSQL) basta un UPDATE condicional; en
+        MySQL se lee la fila y se aplica un UPDATE protegido por el token.
+        """
+        token = confirmation_data.token
+        now = datetime.utcnow()
+        valid_token = (
+            (User.confirmation_token == token)
+            & (User.email_confirmed.is_(False))
+            & or_(User.token_expires_at.is_(None), User.token_expires_at >= now)
+        )
+
+        user = None
+        if getattr(self.db.get_bind().dialect, "update_returning", False):
+            user = self.db.scalars(
+                update(User)
+                .where(valid_token)
+                .values(**self._confirm_values(), updated_at=now)
+                .returning(User),
+                execution_options={"synchronize_session": False},
+            ).first()
+            if user is None:
+                # Sólo en el caso de error se consulta el motivo
+                self._raise_invalid_confirmation(token, now)
+        else:
+            user = (
+                self.db.query(User)
+                .options(WITH_CONFIRMATION)
+                .filter(User.confirmation_token == token)
+                .first()
+            )
+            self._check_confirmation(user, now)
+
+            # UPDATE protegido: si otro proceso confirmó antes, no afecta filas
+            updated = self.db.execute(
+                update(User)
+                .where(User.id == user.id, valid_token)
+                .values(**self._confirm_values(), updated_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                self.db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Token de confirmación inválido",
+                )
+            for key, value in {**self._confirm_values(), "updated_at": now}.items():
+                set_committed_value(user, key, value)
+
+        self.db.commit()
+        user_stats.record_confirmed()
+
+        # Enviar email de bienvenida
+        try:
+            self.email_service.send_welcome_email(
+                user.email, f"{user.name} {user.last_name}"
+            )
+        except Exception as e:
+            print(f"Error enviando email de bienvenida: {e}")
+
+        return user
+
+    def _raise_invalid_confirmation(self, token: str, now: datetime) -> None:
         user = (
             self.db.query(User)
-            .filter(User.confirmation_token == confirmation_data.token)
+            .options(WITH_CONFIRMATION)
+            .filter(User.confirmation_token == token)
             .first()
         )
+        self._check_confirmation(user, now)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token de confirmación inválido",
+        )
 
+    def _check_confirmation(self, user: Optional[User], now: datetime) -> None:
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -106,34 +220,20 @@ class AuthController:
             )
 
         # Verificar si el token ha expirado
-        if user.token_expires_at and datetime.utcnow() > user.token_expires_at:
+        if user.token_expires_at and now > user.token_expires_at:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El token de confirmación ha expirado",
             )
 
-        # Confirmar usuario
-        user.email_confirmed = True
-        user.confirmation_token = None
-        user.token_expires_at = None
-        user.confirmation_sent_at = None
-        self.db.commit()
-        self.db.refresh(user)
-
-        # Enviar email de bienvenida
-        try:
-            self.email_service.send_welcome_email(
-                user.email, f"{user.name} {user.last_name}"
-            )
-        except Exception as e:
-            print(f"Error enviando email de bienvenida: {e}")
-
-        return user
-
+    @traced()
     def resend_confirmation_email(self, resend_data: ResendConfirmation) -> bool:
         """Reenviar email de confirmación"""
         user = (
-            self.db.query(User).filter(User.email == resend_data.email).first()
+            self.db.query(User)
+            .options(WITH_CONFIRMATION)
+            .filter(User.email == resend_data.email)
+            .first()
         )
 
         if not user:
@@ -159,11 +259,15 @@ class AuthController:
 
         return self.send_confirmation_email(user)
 
+    @traced()
     def authenticate_user(self, login_data: UserLogin) -> tuple[User, str]:
         """Autenticar usuario y generar token"""
 
         user = (
-            self.db.query(User).filter(User.email == login_data.email).first()
+            self.db.query(User)
+            .options(WITH_CREDENTIALS)
+            .filter(User.email == login_data.email)
+            .first()
         )
 
         if not user:
@@ -185,9 +289,8 @@ class AuthController:
                 detail="Email o contraseña incorrectos",
             )
 
-        # Actualizar timestamp de último login (necesitarás agregar este campo)
-        # user.last_login = datetime.utcnow()
-        self.db.commit()
+        # Último login: escritura diferida, sin UPDATE en la petición
+        activity_tracker.record_login(user.id)
 
         # Crear token JWT
         access_token_expires = timedelta(days=30)
@@ -202,9 +305,15 @@ class AuthController:
 
         return user, access_token
 
-    def get_user_profile(self, user_id: int) -> User:
-        """Obtener perfil de usuario"""
-        user = self.db.query(User).filter(User.id == user_id).first()
+    @traced()
+    def get_user_profile(self, user_id: int, *options) -> User:
+        """Obtener perfil de usuario (por defecto sólo las columnas de UserResponse)"""
+        user = (
+            self.db.query(User)
+            .options(*(options or (project(UserResponse),)))
+            .filter(User.id == user_id)
+            .first()
+        )
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
@@ -212,9 +321,10 @@ class AuthController:
             )
         return user
 
+    @traced()
     def update_password(self, user_id: int, password_data: PasswordUpdate) -> User:
         """Actualizar contraseña del usuario"""
-        user = self.get_user_profile(user_id)
+        user = self.get_user_profile(user_id, WITH_CREDENTIALS)
 
         # Verificar contraseña actual usando el método del modelo
         if not user.check_password(password_data.current_password):
@@ -226,21 +336,34 @@ class AuthController:
         # Actualizar con nueva contraseña
         user.set_password(password_data.new_password)
         self.db.commit()
-        self.db.refresh(user)
         return user
 
+    @traced()
+    def change_user_role(self, user_id: int, new_role: str) -> User:
+        """Cambiar el rol de un usuario"""
+        user = self.get_user_profile(user_id)
+
+        old_role = user.role
+        user.role = UserRole(new_role)
+        self.db.commit()
+        user_stats.record_role_changed(old_role, user.role)
+        return user
+
+    @traced()
     def delete_user(self, user_id: int) -> bool:
         """Eliminar usuario"""
         user = self.get_user_profile(user_id)
         self.db.delete(user)
         self.db.commit()
+        user_stats.record_deleted(user)
         return True
 
+    @traced()
     def get_all_users(
         self, skip: int = 0, limit: int = 100, role: Optional[str] = None
     ) -> List[User]:
         """Obtener lista de usuarios"""
-        query = self.db.query(User)
+        query = self.db.query(User).options(project(UserListItem))
 
         if role:
             try:
@@ -252,4 +375,304 @@ class AuthController:
                     detail=f"Rol '{role}' no válido"
                 )
 
-        return query.offset(skip).limit(limit).all()
\ No newline at end of file
+        return query.offset(skip).limit(limit).all()
+
+    @traced()
+    def get_user_stats(self) -> dict:
+        """Estadísticas de usuarios desde la caché en memoria"""
+        user_stats.ensure_fresh(self.db)
+        return user_stats.snapshot()
+
+    @traced()
+    def get_users_by_ids(self, user_ids: List[int], fields: Optional[List[str]] = None) -> dict:
+        """Obtener varios usuarios por ID con consultas IN por lotes"""
+        names = ["id", *(f for f in (fields or UserResponse.model_fields) if f != "id")]
+        columns = [getattr(User, name) for name in names]
+
+        # Quitar duplicados manteniendo el orden
+        user_ids = list(dict.fromkeys(user_ids))
+        users = {}
+        for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+            chunk = user_ids[start:start + BULK_CHUNK_SIZE]
+            for row in self.db.execute(select(*columns).where(User.id.in_(chunk))):
+                user = dict(zip(names, row))
+                if "role" in user:
+                    user["role"] = user["role"].value
+                users[user["id"]] = user
+
+        if fields is not None and "id" not in fields:
+            for user in users.values():
+                del user["id"]
+        return {
+            "users": {user_id: users[user_id] for user_id in user_ids if user_id in users},
+            "missing": [user_id for user_id in user_ids if user_id not in users],
+        }
+
+    @traced()
+    def introspect_tokens(self, tokens: List[str]) -> List[dict]:
+        """Verificar varios tokens y resolver sus usuarios con un solo IN"""
+        decoded = {}
+        for token in set(tokens):
+            payload = verify_token(token)
+            try:
+                decoded[token] = (int(payload["sub"]), payload.get("exp"))
+            except (TypeError, KeyError, ValueError):
+                decoded[token] = None
+
+        user_ids = {entry[0] for entry in decoded.values() if entry is not None}
+        users = {}
+        if user_ids:
+            rows = self.db.execute(
+                select(User.id, User.role, User.email_confirmed).where(User.id.in_(user_ids))
+            )
+            users = {row.id: row for row in rows}
+
+        results = []
+        for token in tokens:
+            entry = decoded[token]
+            user = users.get(entry[0]) if entry is not None else None
+            if user is None:
+                results.append({"active": False})
+                continue
+            user_id, exp = entry
+            results.append({
+                # Mismo criterio que get_current_user: el email debe estar confirmado
+                "active": bool(user.email_confirmed),
+                "user_id": user_id,
+                "role": user.role.value,
+                "email_confirmed": bool(user.email_confirmed),
+                "expires_at": datetime.utcfromtimestamp(exp) if exp else None,
+            })
+        return results
+
+    def _iter_bulk_chunks(self, selection: BulkUserSelection):
+        """Recorrer en lotes los IDs seleccionados por lista o por filtro"""
+        if selection.user_ids is not None:
+            # Quitar duplicados manteniendo el orden
+            user_ids = list(dict.fromkeys(selection.user_ids))
+            for start in range(0, len(user_ids), BULK_CHUNK_SIZE):
+                yield user_ids[start:start + BULK_CHUNK_SIZE]
+            return
+
+        filters = selection.filters
+        conditions = []
+        if filters.role:
+            conditions.append(User.role == UserRole(filters.role))
+        if filters.unconfirmed_before:
+            conditions.append(User.email_confirmed.is_(False))
+            conditions.append(User.created_at < filters.unconfirmed_before)
+
+        # Paginación por clave primaria para no releer filas ya procesadas
+        last_id = 0
+        while True:
+            rows = (
+                self.db.query(User.id)
+                .filter(*conditions, User.id > last_id)
+                .order_by(User.id)
+                .limit(BULK_CHUNK_SIZE)
+                .all()
+            )
+            if not rows:
+                return
+            chunk = [row.id for row in rows]
+            yield chunk
+            last_id = chunk[-1]
+
+    def _bulk_apply(
+        self,
+        selection: BulkUserSelection,
+        current_user_id: int,
+        self_detail: str,
+        success_status: str,
+        apply_chunk,
+    ) -> dict:
+        """Aplicar una operación set-based por lotes y devolver el resultado.
+
+        Con lista de IDs se devuelve el resultado de cada ID. Con filtro el
+        número de filas no está acotado: sólo se devuelven los contadores y
+        los IDs que no tuvieron éxito.
+        """
+        report_successes = selection.user_ids is not None
+        processed = 0
+        succeeded = 0
+        results = []
+        for chunk in self._iter_bulk_chunks(selection):
+            existing = {
+                row.id
+                for row in self.db.query(User.id).filter(User.id.in_(chunk)).all()
+            }
+            targets = [
+                user_id for user_id in chunk
+                if user_id in existing and user_id != current_user_id
+            ]
+
+            if targets:
+                apply_chunk(targets)
+                self.db.commit()
+
+            processed += len(chunk)
+            succeeded += len(targets)
+            for user_id in chunk:
+                if user_id == current_user_id:
+                    results.append(
+                        {"user_id": user_id, "status": "skipped", "detail": self_detail}
+                    )
+                elif user_id in existing:
+                    if report_successes:
+                        results.append({"user_id": user_id, "status": success_status})
+                else:
+                    results.append(
+                        {"user_id": user_id, "status": "not_found", "detail": "Usuario no encontrado"}
+                    )
+        return {"processed": processed, "succeeded": succeeded, "results": results}
+
+    @traced()
+    def bulk_update_role(
+        self, selection: BulkUserSelection, new_role: str, current_user_id: int
+    ) -> dict:
+        """Cambiar el rol de varios usuarios con UPDATE por lotes"""
+        user_role = UserRole(new_role)
+
+        def apply_chunk(targets: List[int]):
+            self.db.query(User).filter(User.id.in_(targets)).update(
+                {User.role: user_role, User.updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+
+        outcome = self._bulk_apply(
+            selection,
+            current_user_id,
+            "No puedes cambiar tu propio rol",
+            "updated",
+            apply_chunk,
+        )
+        user_stats.invalidate()
+        return outcome
+
+    @traced()
+    def bulk_delete_users(
+        self, selection: BulkUserSelection, current_user_id: int
+    ) -> dict:
+        """Eliminar varios usuarios con DELETE por lotes"""
+
+        def apply_chunk(targets: List[int]):
+            self.db.query(User).filter(User.id.in_(targets)).delete(
+                synchronize_session=False
+            )
+
+        outcome = self._bulk_apply(
+            selection,
+            current_user_id,
+            "No puedes eliminarte a ti mismo",
+            "deleted",
+            apply_chunk,
+        )
+        user_stats.invalidate()
+        return outcome
+
+    @staticmethod
+    def _encode_search_cursor(score: float, user_id: int) -> str:
+        raw = json.dumps({"s": score, "i": user_id}).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def _decode_search_cursor(cursor: str) -> Tuple[float, int]:
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return float(data["s"]), int(data["i"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor de búsqueda inválido",
+            )
+
+    @traced()
+    def search_users(
+        self, query: str, limit: int = 20, cursor: Optional[str] = None
+    ) -> Tuple[List[Tuple[User, float]], Optional[str]]:
+        """Buscar usuarios por nombre/apellido (tokens) y prefijo de email.
+
+        Cada rama de la búsqueda usa un índice (FULLTEXT en MySQL, índices
+        NOCASE en SQLite y el índice único de email) y está limitada a
+        SEARCH_MAX_CANDIDATES filas. Los resultados se ordenan por puntuación
+        y se paginan con un cursor (puntuación, id).
+        """
+        query = query.strip().lower()
+        if not query:
+            # Sólo espacios: no hay prefijo de email ni tokens que buscar
+            return [], None
+        tokens = re.findall(r"[^\W_]+", query)[:SEARCH_MAX_TOKENS]
+        is_mysql = self.db.get_bind().dialect.name == "mysql"
+
+        # Prefijo de email como rango sobre el índice único de email
+        params = {"email_from": query}
+        if is_mysql:
+            params["email_from"] = (
+                query.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+            )
+            email_condition = "email LIKE :email_from ESCAPE '!'"
+        else:
+            params["email_to"] = query[:-1] + chr(ord(query[-1]) + 1)
+            email_condition = "email >= :email_from AND email < :email_to"
+        branches = [
+            f"SELECT id, {SEARCH_EMAIL_SCORE} AS score FROM users "
+            f"WHERE {email_condition} LIMIT {SEARCH_MAX_CANDIDATES}"
+        ]
+
+        if tokens:
+            if is_mysql:
+                # Modo booleano: cada token como prefijo, puntuación de relevancia
+                params["fulltext"] = " ".join(f"{token}*" for token in tokens)
+                branches.append(
+                    "SELECT id, MATCH (name, last_name) AGAINST (:fulltext IN BOOLEAN MODE) AS score "
+                    "FROM users WHERE MATCH (name, last_name) AGAINST (:fulltext IN BOOLEAN MODE) "
+                    f"LIMIT {SEARCH_MAX_CANDIDATES}"
+                )
+            else:
+                # Un punto por cada token que coincide como prefijo de nombre o apellido
+                for i, token in enumerate(tokens):
+                    params[f"token_{i}"] = f"{token}%"
+                    for column in ("name", "last_name"):
+                        branches.append(
+                            f"SELECT id, 1.0 AS score FROM users WHERE {column} LIKE :token_{i} "
+                            f"LIMIT {SEARCH_MAX_CANDIDATES}"
+                        )
+
+        union = " UNION ALL ".join(
+            f"SELECT id, score FROM ({branch}) AS branch_{i}"
+            for i, branch in enumerate(branches)
+        )
+        ranked = (
+            text(
+                f"SELECT id, SUM(score) AS score FROM ({union}) AS candidates GROUP BY id"
+            )
+            .bindparams(**params)
+            .columns(id=Integer, score=Float)
+            .subquery("ranked")
+        )
+
+        results = (
+            self.db.query(User, ranked.c.score)
+            .options(project(UserListItem))
+            .join(ranked, User.id == ranked.c.id)
+        )
+        if cursor:
+            cursor_score, cursor_id = self._decode_search_cursor(cursor)
+            results = results.filter(
+                (ranked.c.score < cursor_score)
+                | ((ranked.c.score == cursor_score) & (ranked.c.id > cursor_id))
+            )
+
+        rows = (
+            results.order_by(ranked.c.score.desc(), ranked.c.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_user, last_score = rows[-1]
+            next_cursor = self._encode_search_cursor(float(last_score), last_user.id)
+
+        return [(user, float(score)) for user, score in rows], next_cursor
@@ -0,0 +1,275 @@
+"""Datos sintéticos para pruebas de carga y reseteo de tablas.
+
+Uso:
+    python -m app.db.seed seed --rows 1000000 --workers 4
+    python -m app.db.seed seed --rows 2000000 --method load-data   (sólo MySQL)
+    python -m app.db.seed truncate
+    python -m app.db.seed reset
+
+- seed: genera usuarios con nombres, roles y fechas realistas. Las
+  contraseñas salen de un pool de hashes bcrypt precalculados
+  (--hash-pool): el usuario n tiene la contraseña "<prefijo><n % pool>", así
+  que las pruebas de /login conocen las credenciales sin que la carga
+  calcule bcrypt por fila.
+- Los lotes se insertan en paralelo (--workers), cada uno en su propia
+  transacción. Con --method insert se usa executemany, que pymysql reescribe
+  como INSERT de varias filas; con --method load-data cada lote se escribe en
+  un fichero temporal y se carga con LOAD DATA LOCAL INFILE (requiere
+  local_infile=ON en el servidor).
+- truncate: vacía users y users_archive. reset: borra y recrea las tablas.
+
+Las operaciones piden confirmación salvo con --yes. SQLite sólo admite un
+escritor, así que allí se usa un único worker.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import List
+
+import bcrypt
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import make_url
+
+from ..config import DATABASE_URL
+from ..models.database import Base, build_engine
+from ..models.usuario import User, UserArchive, UserRole
+
+SEED_PASSWORD_PREFIX = os.getenv("SEED_PASSWORD_PREFIX", "loadtest")
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "Lucía", "Javier", "María", "Diego", "Sofía", "Pablo",
+    "Laura", "Andrés", "Valentina", "Miguel", "Camila", "Jorge", "Isabel",
+    "Mateo", "Paula", "Daniel", "Elena", "Sergio", "Marta", "Alejandro",
+    "Carmen", "Raúl", "Julia", "Fernando", "Natalia", "Hugo", "Daniela", "Iván",
+]
+LAST_NAMES = [
+    "García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Fernández",
+    "Rodríguez", "Díaz", "Torres", "Ramírez", "Flores", "Morales", "Romero",
+    "Herrera", "Castillo", "Ortiz", "Navarro", "Ruiz", "Vargas", "Molina",
+    "Delgado", "Castro", "Rojas", "Silva", "Mendoza", "Guerrero", "Medina",
+]
+# Reparto aproximado de roles: (rol, peso)
+ROLE_WEIGHTS = [(UserRole.CLIENT, 90), (UserRole.ARTIST, 9), (UserRole.ADMIN, 1)]
+
+COLUMNS = [
+    "name", "last_name", "email", "email_confirmed", "password", "role",
+    "created_at", "updated_at", "last_login", "last_seen_at",
+]
+
+
+def build_hash_pool(size: int, rounds: int) -> List[str]:
+    """Precalcular los hashes bcrypt de "<prefijo>0" ... "<prefijo>{size-1}" """
+    def hash_one(i: int) -> str:
+        password = f"{SEED_PASSWORD_PREFIX}{i}".encode("utf-8")
+        return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        return list(pool.map(hash_one, range(size)))
+
+
+def generate_rows(start: int, count: int, hash_pool: List[str], confirmed_ratio: float, seed: int):
+    """Filas de users para los números de secuencia start .. start+count-1"""
+    rng = random.Random(seed + start)
+    now = datetime.utcnow()
+    roles, weights = zip(*ROLE_WEIGHTS)
+    rows = []
+    for n in range(start, start + count):
+        name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        confirmed = rng.random() < confirmed_ratio
+        last_login = None
+        if confirmed and rng.random() < 0.7:
+            last_login = created_at + (now - created_at) * rng.random()
+        rows.append({
+            "name": name,
+            "last_name": last_name,
+            # El número de secuencia garantiza emails únicos
+            "email": f"{name}.{last_name}.{n}@example.com".lower(),
+            "email_confirmed": confirmed,
+            "password": hash_pool[n % len(hash_pool)],
+            "role": rng.choices(roles, weights)[0],
+            "created_at": created_at,
+            "updated_at": created_at,
+            "last_login": last_login,
+            "last_seen_at": last_login,
+        })
+    return rows
+
+
+def _load_data_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, UserRole):
+        # SQLAlchemy guarda el nombre del miembro del Enum
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class Seeder:
+    def __init__(self, engine, method: str = "insert", workers: int = 4):
+        if method == "load-data" and engine.dialect.name != "mysql":
+            raise ValueError("--method load-data sólo está disponible con MySQL")
+        self.engine = engine
+        self.method = method
+        self.workers = 1 if engine.dialect.name == "sqlite" else max(1, workers)
+        self.inserted = 0
+
+    def next_sequence(self) -> int:
+        """Primer número de secuencia libre (para poder sembrar varias veces)"""
+        with self.engine.connect() as conn:
+            return (conn.execute(select(func.max(User.id))).scalar() or 0) + 1
+
+    def _insert_chunk(self, rows) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(insert(User.__table__), rows)
+
+    def _load_data_chunk(self, rows) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False, encoding="utf-8") as f:
+            for row in rows:
+                f.write("\t".join(_load_data_value(row[c]) for c in COLUMNS) + "\n")
+            path = f.name
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    f"LOAD DATA LOCAL INFILE :path INTO TABLE {User.__tablename__} "
+                    "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' "
+                    f"({', '.join(COLUMNS)})"
+                ), {"path": path})
+        finally:
+            os.unlink(path)
+
+    def _run_chunk(self, start, count, hash_pool, confirmed_ratio, seed) -> int:
+        rows = generate_rows(start, count, hash_pool, confirmed_ratio, seed)
+        if self.method == "load-data":
+            self._load_data_chunk(rows)
+        else:
+            self._insert_chunk(rows)
+        return count
+
+    def seed(self, rows: int, chunk_size: int, hash_pool: List[str],
+             confirmed_ratio: float = 0.8, seed: int = 42) -> float:
+        """Insertar `rows` usuarios; devuelve la duración en segundos"""
+        first = self.next_sequence()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(
+                    self._run_chunk, start, min(chunk_size, first + rows - start),
+                    hash_pool, confirmed_ratio, seed,
+                )
+                for start in range(first, first + rows, chunk_size)
+            ]
+            for future in as_completed(futures):
+                self.inserted += future.result()
+                elapsed = time.perf_counter() - started
+                print(
+                    f"\r  {self.inserted:>10,} / {rows:,} filas"
+                    f"  {self.inserted / max(elapsed, 1e-9):>10,.0f} filas/s",
+                    end="", flush=True,
+                )
+        print()
+        return time.perf_counter() - started
+
+
+def truncate_tables(engine) -> None:
+    tables = [User.__table__, UserArchive.__table__]
+    with engine.begin() as conn:
+        for table in tables:
+            if engine.dialect.name == "sqlite":
+                conn.execute(table.delete())
+            else:
+                conn.execute(text(f"TRUNCATE TABLE {table.name}"))
+
+
+def reset_tables(engine) -> None:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def confirm(action: str, engine) -> bool:
+    target = engine.url.render_as_string(hide_password=True)
+    answer = input(f"¿Seguro que quieres {action} en {target}? (si/no): ")
+    return answer.lower() in ["si", "sí", "yes", "y"]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Datos sintéticos y reseteo de tablas")
+    parser.add_argument("--yes", action="store_true", help="No pedir confirmación")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Generar usuarios sintéticos")
+    seed_parser.add_argument("--rows", type=int, default=100000)
+    seed_parser.add_argument("--chunk-size", type=int, default=5000)
+    seed_parser.add_argument("--workers", type=int, default=4)
+    seed_parser.add_argument("--method", choices=["insert", "load-data"], default="insert")
+    seed_parser.add_argument("--hash-pool", type=int, default=16, help="Hashes bcrypt precalculados")
+    seed_parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    seed_parser.add_argument("--confirmed-ratio", type=float, default=0.8)
+    seed_parser.add_argument("--seed", type=int, default=42, help="Semilla aleatoria")
+    seed_parser.add_argument("--truncate", action="store_true", help="Vaciar users antes de sembrar")
+
+    commands.add_parser("truncate", help="Vaciar users y users_archive")
+    commands.add_parser("reset", help="Borrar y recrear todas las tablas")
+    args = parser.parse_args(argv)
+
+    overrides = {"echo": False}
+    if args.command == "seed" and make_url(DATABASE_URL).get_backend_name() != "sqlite":
+        # Una conexión por worker
+        overrides.update(pool_size=args.workers, max_overflow=0)
+        if args.method == "load-data":
+            overrides["connect_args"] = {"local_infile": True}
+    engine = build_engine(DATABASE_URL, **overrides)
+
+    if args.command == "seed":
+        action = f"insertar {args.rows:,} usuarios"
+        if args.truncate:
+            action += " tras vaciar las tablas"
+    else:
+        action = {"truncate": "vaciar las tablas", "reset": "borrar y recrear las tablas"}[args.command]
+    if not args.yes and not confirm(action, engine):
+        print("Operación cancelada")
+        sys.exit(1)
+
+    if args.command == "reset":
+        reset_tables(engine)
+        print("✅ Tablas recreadas")
+        return
+
+    if args.command == "truncate":
+        truncate_tables(engine)
+        print("✅ Tablas vaciadas")
+        return
+
+    Base.metadata.create_all(engine)
+    if args.truncate:
+        truncate_tables(engine)
+
+    print(f"Calculando {args.hash_pool} hashes bcrypt (rounds={args.bcrypt_rounds})...")
+    hash_pool = build_hash_pool(args.hash_pool, args.bcrypt_rounds)
+
+    seeder = Seeder(engine, method=args.method, workers=args.workers)
+    print(f"Insertando {args.rows:,} usuarios ({args.method}, {seeder.workers} workers)")
+    elapsed = seeder.seed(
+        args.rows, args.chunk_size, hash_pool,
+        confirmed_ratio=args.confirmed_ratio, seed=args.seed,
+    )
+    print(
+        f"✅ {seeder.inserted:,} usuarios en {elapsed:.1f}s "
+        f"({seeder.inserted / max(elapsed, 1e-9):,.0f} filas/s)"
+    )
+    print(f"Contraseñas: '{SEED_PASSWORD_PREFIX}<n % {args.hash_pool}>' (n = número del email)")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
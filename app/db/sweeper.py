@@ -0,0 +1,272 @@
+"""Barrido de mantenimiento de la tabla users.
+
+- Limpia tokens de confirmación expirados.
+- Opcional (SWEEPER_MODE=purge|archive, por defecto off): purga o archiva en
+  users_archive las cuentas sin confirmar más antiguas que
+  SWEEPER_MAX_AGE_DAYS.
+
+Con varios workers cada uno arranca su hilo, pero sólo barre el que obtiene
+el lock de líder (GET_LOCK en MySQL, lock de fichero en otro caso); el resto
+se salta la vuelta. También se puede desactivar el hilo
+(SWEEPER_INTERVAL_MINUTES=0) y lanzar el barrido desde cron con la CLI.
+
+Trabaja en lotes pequeños (UPDATE/DELETE ... WHERE id IN (...)) con una pausa
+entre lotes para no mantener bloqueos largos sobre la tabla.
+
+Uso:
+    python -m app.db.sweeper --dry-run
+    python -m app.db.sweeper --mode archive --max-age-days 15
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import DateTime, delete, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from ..models.database import SessionLocal, named_lock
+from ..models.usuario import User, UserArchive
+from ..services.stats_service import user_stats
+from ..utils.metrics import metrics
+
+SWEEPER_INTERVAL_MINUTES = float(os.getenv("SWEEPER_INTERVAL_MINUTES", "60"))
+SWEEPER_MAX_AGE_DAYS = int(os.getenv("SWEEPER_MAX_AGE_DAYS", "30"))
+SWEEPER_CHUNK_SIZE = int(os.getenv("SWEEPER_CHUNK_SIZE", "500"))
+SWEEPER_PAUSE_SECONDS = float(os.getenv("SWEEPER_PAUSE_SECONDS", "0.2"))
+SWEEPER_MODE = os.getenv("SWEEPER_MODE", "off")  # off | purge | archive
+SWEEPER_DRY_RUN = os.getenv("SWEEPER_DRY_RUN", "false").lower() == "true"
+SWEEPER_LOCK_NAME = "users_sweeper"
+SWEEPER_LOCK_FILE = os.getenv(
+    "SWEEPER_LOCK_FILE", os.path.join(tempfile.gettempdir(), "users_sweeper.lock")
+)
+SWEEPER_MODES = ("off", "purge", "archive")
+
+
+@dataclass
+class SweepResult:
+    tokens_cleared: int = 0
+    accounts_purged: int = 0
+    accounts_archived: int = 0
+    chunks: int = 0
+    dry_run: bool = False
+    duration_seconds: float = 0.0
+
+
+class TokenSweeper:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        chunk_size: int = SWEEPER_CHUNK_SIZE,
+        pause_seconds: float = SWEEPER_PAUSE_SECONDS,
+        max_age_days: int = SWEEPER_MAX_AGE_DAYS,
+        mode: str = SWEEPER_MODE,
+        dry_run: bool = SWEEPER_DRY_RUN,
+    ):
+        if mode not in SWEEPER_MODES:
+            raise ValueError(f"Modo '{mode}' no válido ({', '.join(SWEEPER_MODES)})")
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.pause_seconds = pause_seconds
+        self.max_age_days = max_age_days
+        self.mode = mode
+        self.dry_run = dry_run
+
+    def _iter_id_chunks(self, db: Session, condition):
+        """Recorrer los IDs que cumplen la condición en lotes (paginación por clave)"""
+        last_id = 0
+        while True:
+            ids: List[int] = list(
+                db.execute(
+                    select(User.id)
+                    .where(condition, User.id > last_id)
+                    .order_by(User.id)
+                    .limit(self.chunk_size)
+                ).scalars()
+            )
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+            if len(ids) < self.chunk_size:
+                return
+
+    def _pause(self) -> None:
+        if self.pause_seconds and not self.dry_run:
+            time.sleep(self.pause_seconds)
+
+    def clear_expired_tokens(self, db: Session, now: datetime, result: SweepResult) -> None:
+        """Limpiar tokens de confirmación expirados"""
+        condition = User.token_expires_at < now
+        for ids in self._iter_id_chunks(db, condition):
+            result.chunks += 1
+            if self.dry_run:
+                result.tokens_cleared += len(ids)
+                continue
+
+            # Se repite la condición por si el token se renovó entre lotes
+            cleared = db.execute(
+                update(User)
+                .where(User.id.in_(ids), condition)
+                .values(
+                    confirmation_token=None,
+                    token_expires_at=None,
+                    confirmation_sent_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            result.tokens_cleared += cleared
+            metrics.inc("sweeper.tokens_cleared", cleared)
+            self._pause()
+
+    def sweep_stale_accounts(self, db: Session, now: datetime, result: SweepResult) -> None:
+        """Purgar o archivar cuentas sin confirmar más antiguas que max_age_days"""
+        if self.mode == "off":
+            return
+        cutoff = now - timedelta(days=self.max_age_days)
+        condition = (User.email_confirmed.is_(False)) & (User.created_at < cutoff)
+
+        for ids in self._iter_id_chunks(db, condition):
+            result.chunks += 1
+            if self.dry_run:
+                if self.mode == "archive":
+                    result.accounts_archived += len(ids)
+                else:
+                    result.accounts_purged += len(ids)
+                continue
+
+            if self.mode == "archive":
+                db.execute(
+                    insert(UserArchive).from_select(
+                        ["id", "name", "last_name", "email", "role", "created_at", "archived_at"],
+                        select(
+                            User.id, User.name, User.last_name, User.email,
+                            User.role, User.created_at, literal(now, DateTime),
+                        ).where(User.id.in_(ids), condition),
+                    )
+                )
+
+            removed = db.execute(
+                delete(User)
+                .where(User.id.in_(ids), condition)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+
+            if self.mode == "archive":
+                result.accounts_archived += removed
+                metrics.inc("sweeper.accounts_archived", removed)
+            else:
+                result.accounts_purged += removed
+                metrics.inc("sweeper.accounts_purged", removed)
+            self._pause()
+
+    def run_once(self) -> SweepResult:
+        """Ejecutar un barrido completo"""
+        started = time.perf_counter()
+        result = SweepResult(dry_run=self.dry_run)
+        now = datetime.utcnow()
+
+        db = self.session_factory()
+        try:
+            # Primero las cuentas viejas: así no se limpian tokens de filas que se van a borrar
+            self.sweep_stale_accounts(db, now, result)
+            self.clear_expired_tokens(db, now, result)
+        except Exception:
+            db.rollback()
+            metrics.inc("sweeper.errors")
+            raise
+        finally:
+            db.close()
+
+        if result.accounts_purged or result.accounts_archived:
+            user_stats.invalidate()
+
+        result.duration_seconds = time.perf_counter() - started
+        metrics.inc("sweeper.runs")
+        metrics.set_gauge("sweeper.last_run_seconds", result.duration_seconds)
+        metrics.set_gauge("sweeper.last_run_at", time.time())
+        return result
+
+    def run_as_leader(self) -> Optional[SweepResult]:
+        """Barrer sólo si se obtiene el lock de líder; None si otro lo tiene"""
+        with leader_lock() as acquired:
+            if not acquired:
+                metrics.inc("sweeper.skipped_not_leader")
+                return None
+            return self.run_once()
+
+
+def leader_lock():
+    """Lock exclusivo y no bloqueante para que sólo un proceso barra a la vez"""
+    return named_lock(SWEEPER_LOCK_NAME, timeout=0, lock_file=SWEEPER_LOCK_FILE)
+
+
+class SweeperThread(threading.Thread):
+    """Hilo en segundo plano que ejecuta el barrido periódicamente"""
+
+    def __init__(self, sweeper: TokenSweeper, interval_seconds: float):
+        super().__init__(name="token-sweeper", daemon=True)
+        self.sweeper = sweeper
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                result = self.sweeper.run_as_leader()
+                if result is not None:
+                    print(f"Barrido de mantenimiento completado: {asdict(result)}")
+            except Exception as e:
+                print(f"Error en el barrido de mantenimiento: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+_sweeper_thread: Optional[SweeperThread] = None
+
+
+def start_sweeper() -> Optional[SweeperThread]:
+    """Arrancar el barrido periódico (SWEEPER_INTERVAL_MINUTES <= 0 lo desactiva)"""
+    global _sweeper_thread
+    if SWEEPER_INTERVAL_MINUTES <= 0 or _sweeper_thread is not None:
+        return _sweeper_thread
+    _sweeper_thread = SweeperThread(TokenSweeper(), SWEEPER_INTERVAL_MINUTES * 60)
+    _sweeper_thread.start()
+    return _sweeper_thread
+
+
+def stop_sweeper() -> None:
+    global _sweeper_thread
+    if _sweeper_thread is not None:
+        _sweeper_thread.stop()
+        _sweeper_thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barrido de tokens y cuentas sin confirmar")
+    parser.add_argument("--dry-run", action="store_true", help="Sólo contar, sin modificar")
+    parser.add_argument("--mode", choices=SWEEPER_MODES, default=SWEEPER_MODE)
+    parser.add_argument("--max-age-days", type=int, default=SWEEPER_MAX_AGE_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=SWEEPER_CHUNK_SIZE)
+    parser.add_argument("--pause", type=float, default=SWEEPER_PAUSE_SECONDS)
+    args = parser.parse_args()
+
+    sweeper = TokenSweeper(
+        chunk_size=args.chunk_size,
+        pause_seconds=args.pause,
+        max_age_days=args.max_age_days,
+        mode=args.mode,
+        dry_run=args.dry_run,
+    )
+    result = sweeper.run_as_leader()
+    if result is None:
+        print("Otro proceso está barriendo; no se hace nada")
+    else:
+        print(asdict(result))
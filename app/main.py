@@ -1,18 +1,31 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from .views import usuario_routes
-from .models.database import test_connection, create_tables
+from .views import jwks_routes, usuario_routes
+from .models.database import engine, test_connection, create_tables
+from .server import configure_threadpool
+from .db.sweeper import start_sweeper, stop_sweeper
+from .services.activity_service import start_activity_flusher, stop_activity_flusher
+from .services.email_service import email_retry_queue, smtp_breaker
+from .utils.metrics import metrics
+from .utils.auth_dependencies import require_service
+from .utils.idempotency import IdempotencyMiddleware
+from .utils.tracing import TracingMiddleware, exporter, instrument_engine
+from .utils.profiling import ProfilingMiddleware
+from .utils.deadline import DeadlineMiddleware, instrument_deadlines
+from .utils.security import init_signing_keys, stop_signing_keys
 
 
 # Cargar variables de entorno
 load_dotenv()
 
 
-# Verificar conexión a MySQL antes de iniciar
+# Verificar conexión a la base de datos antes de iniciar
 if not test_connection():
-    raise Exception("No se pudo conectar a MySQL. Verifica tu configuración.")
+    raise Exception(
+        f"No se pudo conectar a la base de datos ({engine.dialect.name}). Verifica tu configuración."
+    )
 
 # Crear todas las tablas
 create_tables()
@@ -26,7 +39,25 @@ app = FastAPI(
     redoc_url="/redoc",
 )
 
-# Configurar CORS
+# Trazas: un span por sentencia SQL
+instrument_engine(engine)
+
+# Plazo máximo por petición, aplicado también a las sentencias SQL
+instrument_deadlines(engine)
+app.add_middleware(DeadlineMiddleware)
+
+# Reintentos seguros con Idempotency-Key (register, resend, change-password)
+app.add_middleware(IdempotencyMiddleware)
+
+# Perfilado bajo demanda (X-Profile: 1) y /debug/memory, sólo admins
+app.add_middleware(ProfilingMiddleware)
+
+# Span raíz por petición (envuelve a los middlewares anteriores)
+app.add_middleware(TracingMiddleware)
+
+# Configurar CORS. Se añade el último para que sea la capa exterior: así
+# también llevan cabeceras CORS las respuestas que generan los propios
+# middlewares (504 del plazo, 409/413/422 de idempotencia, 403/429 de perfilado)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:4200", "http://127.0.0.1:4200"],
@@ -35,8 +66,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Claves de firma JWT (RS256): cargar o generar antes de atender peticiones
+@app.on_event("startup")
+async def startup_signing_keys():
+    init_signing_keys()
+
+
+@app.on_event("shutdown")
+async def shutdown_signing_keys():
+    stop_signing_keys()
+
+
+# Ajustar el threadpool al pool de conexiones de la DB
+@app.on_event("startup")
+async def startup_threadpool():
+    configure_threadpool()
+
+
+# Barrido periódico de tokens expirados y cuentas sin confirmar
+@app.on_event("startup")
+async def startup_sweeper():
+    start_sweeper()
+
+
+@app.on_event("shutdown")
+async def shutdown_sweeper():
+    stop_sweeper()
+
+
+# Volcado diferido de last_login / last_seen_at
+@app.on_event("startup")
+async def startup_activity():
+    start_activity_flusher()
+
+
+@app.on_event("shutdown")
+async def shutdown_activity():
+    stop_activity_flusher()
+
+
+@app.on_event("shutdown")
+async def shutdown_tracing():
+    exporter.shutdown()
+
+
+@app.on_event("shutdown")
+async def shutdown_email_retries():
+    email_retry_queue.shutdown()
+
+
 # Incluir routers
 app.include_router(usuario_routes.router, prefix="/api/v1")
+app.include_router(jwks_routes.router)
 
 
 # Ruta raíz
@@ -46,7 +127,7 @@ def root():
         "mensaje": "Sistema de Autenticación FastAPI",
         "version": "1.0.0",
         "docs": "/docs",
-        "database": "MySQL conectado ✅",
+        "database": f"{engine.dialect.name} conectado ✅",
         "endpoints": {
             "register": "POST /api/v1/auth/register",
             "login": "POST /api/v1/auth/login",
@@ -61,9 +142,19 @@ def root():
 @app.get("/health")
 def health_check():
     db_status = "connected" if test_connection() else "disconnected"
+    smtp_status = smtp_breaker.snapshot()
+    smtp_status["retry_queue"] = len(email_retry_queue)
     return {
-        "status": "healthy",
+        # Con el circuito SMTP abierto los emails se aplazan, pero la API responde
+        "status": "healthy" if smtp_status["state"] == "closed" else "degraded",
         "database": db_status,
+        "smtp": smtp_status,
         "version": "1.0.0",
         "auth": "JWT enabled",
     }
+
+
+# Métricas internas en memoria (sólo servicios internos, X-Service-Token)
+@app.get("/metrics", dependencies=[Depends(require_service)])
+def get_metrics():
+    return metrics.snapshot()
@@ -1,61 +1,251 @@
-from sqlalchemy import create_engine, text  
+import fcntl
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateColumn
 import os
+import time
 
-load_dotenv()
-
-# Configuración de MySQL
-MYSQL_USER = os.getenv("MYSQL_USER", "root")
-MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "")
-MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
-MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
-MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "tatuajes")
+from ..config import (
+    DATABASE_URL,
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+)
+from ..utils.metrics import metrics
 
 
-# URL de conexión a MySQL
-# Manejar contraseña vacía correctamente
-if MYSQL_PASSWORD:
-    DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
-else:
-    DATABASE_URL = (
-        f"mysql+pymysql://{MYSQL_USER}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+def is_memory_sqlite(url) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
     )
 
-# Crear engine con configuración específica para MySQL
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Verificar conexión antes de usar
-    pool_recycle=300,  # Renovar conexiones cada 5 minutos
-    echo=True,  # Mostrar queries SQL (quitar en producción)
-)
+
+def build_engine(url: str = DATABASE_URL, **overrides):
+    """Crear un engine para cualquier URL de SQLAlchemy"""
+    url = make_url(url)
+
+    if url.get_backend_name() == "sqlite":
+        options = {"echo": DB_ECHO, "connect_args": {"check_same_thread": False}}
+        if is_memory_sqlite(url):
+            # Una sola conexión compartida: todas las sesiones ven la misma DB
+            options["poolclass"] = StaticPool
+        options.update(overrides)
+        sqlite_engine = create_engine(url, **options)
+
+        @event.listens_for(sqlite_engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not is_memory_sqlite(url):
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        return sqlite_engine
+
+    options = {
+        "pool_pre_ping": True,  # Verificar conexión antes de usar
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "echo": DB_ECHO,
+    }
+    options.update(overrides)
+    return create_engine(url, **options)
+
+
+engine = build_engine(DATABASE_URL)
 
 # Crear SessionLocal
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: los objetos siguen usables tras el commit sin
+# volver a consultar la fila (evita los refresh posteriores)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 # Base para los modelos
 Base = declarative_base()
 
+# Avisar cuando una petición retiene una conexión más de este tiempo (ms)
+DB_HOLD_WARN_MS = float(os.getenv("DB_HOLD_WARN_MS", "500"))
+
+
+# Medir cuánto tiempo retiene cada sesión una conexión del pool
+@event.listens_for(SessionLocal, "after_begin")
+def _connection_acquired(session, transaction, connection):
+    session.info.setdefault("conn_acquired_at", time.perf_counter())
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _connection_released(session, transaction):
+    if transaction.parent is not None:
+        return
+    acquired_at = session.info.pop("conn_acquired_at", None)
+    if acquired_at is not None:
+        held_ms = (time.perf_counter() - acquired_at) * 1000
+        session.info["conn_hold_ms"] = session.info.get("conn_hold_ms", 0.0) + held_ms
+
+
+class LazySession:
+    """Proxy de Session que no crea la sesión hasta su primer uso.
+
+    Las rutas que terminan antes de tocar la DB (validaciones, guardas como
+    la de auto-borrado) no crean Session ni sacan conexión del pool. La
+    conexión sigue obteniéndose en la primera sentencia, como en cualquier
+    Session de SQLAlchemy.
+    """
+
+    def __init__(self, factory=SessionLocal):
+        self._factory = factory
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    @property
+    def is_active_session(self) -> bool:
+        """Indica si la sesión llegó a crearse"""
+        return self._session is not None
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def close(self) -> float:
+        """Cerrar la sesión (si existe) y devolver el tiempo total de conexión en ms"""
+        if self._session is None:
+            return 0.0
+        self._session.close()
+        return self._session.info.get("conn_hold_ms", 0.0)
+
 
 # Dependencia para obtener la sesión de DB
 def get_db():
-    db = SessionLocal()
+    db = LazySession()
     try:
         yield db
     finally:
-        db.close()
+        held_ms = db.close()
+        if db.is_active_session:
+            metrics.observe("db.connection_hold_ms", held_ms)
+            if held_ms > DB_HOLD_WARN_MS:
+                print(f"Conexión de DB retenida {held_ms:.0f} ms en una petición")
+        else:
+            metrics.inc("db.sessions_skipped")
+
+
+def pool_capacity() -> int:
+    """Número máximo de conexiones simultáneas que puede entregar el pool"""
+    return DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+
+SCHEMA_LOCK_NAME = "users_schema"
+SCHEMA_LOCK_TIMEOUT_SECONDS = 120
+
+
+@contextmanager
+def named_lock(name: str, timeout: float = 0, lock_file: str = None):
+    """Lock exclusivo entre procesos; produce True si se obtuvo.
+
+    MySQL usa GET_LOCK (vale entre workers y entre máquinas); el resto un
+    flock sobre `lock_file` (todos los workers en la misma máquina).
+    Con timeout=0 no espera; con timeout > 0 espera hasta ese tiempo (en
+    SQLite espera sin límite).
+    """
+    if engine.dialect.name == "mysql":
+        with engine.connect() as connection:
+            acquired = connection.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}
+            ).scalar() == 1
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+        return
+
+    lock_file = lock_file or os.path.join(tempfile.gettempdir(), f"{name}.lock")
+    with open(lock_file, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (fcntl.LOCK_NB if timeout <= 0 else 0))
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
 
 # Función para crear todas las tablas
 def create_tables():
-    """Crear todas las tablas en la base de datos"""
-    Base.metadata.create_all(bind=engine) 
+    """Crear todas las tablas en la base de datos.
+
+    Cada worker lo ejecuta al importar la app; el lock hace que sólo uno
+    aplique el DDL a la vez y los demás encuentren el esquema ya al día.
+    """
+    with named_lock(SCHEMA_LOCK_NAME, timeout=SCHEMA_LOCK_TIMEOUT_SECONDS) as acquired:
+        if not acquired:
+            raise RuntimeError("No se pudo obtener el lock del esquema de la DB")
+        Base.metadata.create_all(bind=engine) 
+        add_missing_columns()
+        ensure_indexes()
+
+
+def add_missing_columns():
+    """Añadir a las tablas existentes las columnas nuevas que admiten NULL.
+
+    create_all no modifica tablas ya creadas; sin herramienta de migraciones
+    esto cubre el caso habitual de añadir columnas opcionales al modelo.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                print(f"Columna añadida: {table.name}.{column.name}")
+
+
+def ensure_indexes():
+    """Crear en las tablas existentes los índices propios de cada dialecto.
+
+    Los declarados en table.info["dialect_indexes"] (nombre -> (dialecto, DDL))
+    sólo se crean con la tabla; aquí se añaden los que falten.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            indexes = table.info.get("dialect_indexes", {})
+            if not indexes or not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for name, (dialect, ddl) in indexes.items():
+                if dialect != engine.dialect.name or name in existing:
+                    continue
+                connection.execute(text(ddl))
+                print(f"Índice creado: {table.name}.{name}")
 
 
 # Función para verificar conexión
 def test_connection():
-    """Probar la conexión a MySQL"""
+    """Probar la conexión a la base de datos"""
     try:
         with engine.connect() as connection:
             result = connection.execute(text("SELECT 1"))  # Usar text() aquí
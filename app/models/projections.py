@@ -0,0 +1,31 @@
+# models/projections.py
+"""Proyecciones de columnas para las consultas de sólo lectura.
+
+Las columnas sensibles (password, tokens de confirmación) están diferidas en
+el modelo. Estas opciones permiten además cargar sólo las columnas que
+necesita el schema de respuesta de cada ruta.
+"""
+from functools import lru_cache
+from typing import Tuple
+
+from sqlalchemy.orm import load_only, undefer_group
+
+from .usuario import User
+
+# Grupos de columnas diferidas (ver models/usuario.py)
+WITH_CREDENTIALS = undefer_group("credentials")
+WITH_CONFIRMATION = undefer_group("confirmation")
+
+
+@lru_cache(maxsize=None)
+def columns_for(schema) -> Tuple:
+    """Columnas de User que aparecen en los campos de un schema Pydantic"""
+    mapped = User.__table__.columns.keys()
+    return tuple(
+        getattr(User, field) for field in schema.model_fields if field in mapped
+    )
+
+
+def project(schema):
+    """Opción de consulta que carga sólo las columnas del schema"""
+    return load_only(*columns_for(schema))
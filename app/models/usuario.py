@@ -1,6 +1,8 @@
 # models/usuario.py
-from sqlalchemy import Column, Integer, String, DateTime, Enum, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Boolean, DDL, event
+from sqlalchemy.orm import deferred
 from .database import Base  # ← Importante: importar Base desde database.py
+from ..utils.tracing import start_span
 from datetime import datetime
 import bcrypt
 import enum
@@ -20,22 +22,61 @@ class User(Base):  # ← Usar la Base importada
     last_name = Column(String(50), nullable=False)
     email = Column(String(255), nullable=False, unique=True, index=True)
     email_confirmed = Column(Boolean, default=False)
-    password = Column(String(255), nullable=False)
+    # Columnas sensibles diferidas: sólo se cargan con undefer_group(...)
+    password = deferred(Column(String(255), nullable=False), group="credentials")
     role = Column(Enum(UserRole), default=UserRole.CLIENT)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Agregar campos para confirmación de email
-    confirmation_token = Column(String(10), nullable=True)
-    confirmation_sent_at = Column(DateTime, nullable=True)
-    token_expires_at = Column(DateTime, nullable=True)
+    confirmation_token = deferred(Column(String(10), nullable=True), group="confirmation")
+    confirmation_sent_at = deferred(Column(DateTime, nullable=True), group="confirmation")
+    token_expires_at = deferred(Column(DateTime, nullable=True), group="confirmation")
+
+    # Actividad: se escriben en diferido desde services/activity_service.py
+    last_login = Column(DateTime, nullable=True)
+    last_seen_at = Column(DateTime, nullable=True)
     
     def set_password(self, password: str):
-        salt = bcrypt.gensalt(rounds=12)
-        self.password = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        with start_span("bcrypt.hashpw"):
+            salt = bcrypt.gensalt(rounds=12)
+            self.password = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
     
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password.encode('utf-8'))
+        with start_span("bcrypt.checkpw"):
+            return bcrypt.checkpw(password.encode('utf-8'), self.password.encode('utf-8'))
     
     def __repr__(self):
-        return f"<User(id={self.id}, email='{self.email}', role='{self.role.value}')>"
\ No newline at end of file
+        return f"<User(id={self.id}, email='{self.email}', role='{self.role.value}')>"
+
+
+# Índices para la búsqueda de usuarios por nombre/apellido, por dialecto:
+# - MySQL: índice FULLTEXT (MATCH ... AGAINST en modo booleano)
+# - SQLite: índices NOCASE para que LIKE 'prefijo%' pueda usar el índice
+# Se crean con la tabla y, en tablas ya existentes, desde ensure_indexes()
+User.__table__.info["dialect_indexes"] = {
+    "ix_users_name_fulltext": (
+        "mysql", "CREATE FULLTEXT INDEX ix_users_name_fulltext ON users (name, last_name)"
+    ),
+    "ix_users_name_nocase": (
+        "sqlite", "CREATE INDEX ix_users_name_nocase ON users (name COLLATE NOCASE)"
+    ),
+    "ix_users_last_name_nocase": (
+        "sqlite", "CREATE INDEX ix_users_last_name_nocase ON users (last_name COLLATE NOCASE)"
+    ),
+}
+for _dialect, _ddl in User.__table__.info["dialect_indexes"].values():
+    event.listen(User.__table__, "after_create", DDL(_ddl).execute_if(dialect=_dialect))
+
+
+class UserArchive(Base):
+    """Cuentas sin confirmar archivadas por el barrido de mantenimiento"""
+    __tablename__ = "users_archive"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), nullable=False)
+    last_name = Column(String(50), nullable=False)
+    email = Column(String(255), nullable=False, index=True)
+    role = Column(Enum(UserRole), default=UserRole.CLIENT)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
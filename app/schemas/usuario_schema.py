@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional, List, Literal
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import Optional, List, Literal, Dict
 from datetime import datetime
 
 # Schema para crear usuario
@@ -109,9 +109,35 @@ class UserListItem(BaseModel):
     role: str
     email_confirmed: bool
     created_at: datetime
+    last_login: Optional[datetime] = None
+    last_seen_at: Optional[datetime] = None
 
     model_config = {"from_attributes": True}
 
+# Schema para resultado de búsqueda (con puntuación)
+class UserSearchItem(UserListItem):
+    score: float
+
+# Schema para página de resultados de búsqueda
+class UserSearchResponse(BaseModel):
+    users: List[UserSearchItem]
+    next_cursor: Optional[str] = None
+
+# Schema para usuarios creados por periodo
+class UserCreationStats(BaseModel):
+    today: int
+    last_7_days: int
+    last_30_days: int
+    by_month: Dict[str, int]
+
+# Schema para estadísticas de usuarios
+class UserStatsResponse(BaseModel):
+    total: int
+    by_role: Dict[str, int]
+    by_email_confirmed: Dict[str, int]
+    created: UserCreationStats
+    refreshed_at: Optional[datetime] = None
+
 # Schema para lista paginada
 class UserList(BaseModel):
     users: List[UserListItem]
@@ -123,4 +149,84 @@ class UserList(BaseModel):
 class RegisterResponse(BaseModel):
     message: str
     user: UserResponse
-    confirmation_required: bool = True
\ No newline at end of file
+    confirmation_required: bool = True
+
+# Schema para filtros de operaciones masivas
+class BulkUserFilter(BaseModel):
+    role: Optional[Literal["admin", "client", "artist"]] = Field(
+        None, description="Usuarios con este rol"
+    )
+    unconfirmed_before: Optional[datetime] = Field(
+        None, description="Usuarios sin confirmar creados antes de esta fecha"
+    )
+
+    @model_validator(mode="after")
+    def validate_not_empty(self):
+        if self.role is None and self.unconfirmed_before is None:
+            raise ValueError("El filtro debe incluir al menos un criterio")
+        return self
+
+# Schema para seleccionar usuarios en operaciones masivas (IDs o filtro)
+class BulkUserSelection(BaseModel):
+    user_ids: Optional[List[int]] = Field(
+        None, min_length=1, max_length=5000, description="IDs de usuario"
+    )
+    filters: Optional[BulkUserFilter] = Field(
+        None, description="Filtro alternativo a la lista de IDs"
+    )
+
+    @model_validator(mode="after")
+    def validate_selection(self):
+        if (self.user_ids is None) == (self.filters is None):
+            raise ValueError("Debes indicar 'user_ids' o 'filters' (solo uno)")
+        return self
+
+# Schema para cambio de rol masivo
+class BulkRoleUpdate(BulkUserSelection):
+    new_role: Literal["admin", "client", "artist"] = Field(description="Nuevo rol")
+
+# Schema para el resultado de cada usuario en una operación masiva
+class BulkItemResult(BaseModel):
+    user_id: int
+    status: Literal["updated", "deleted", "not_found", "skipped"]
+    detail: Optional[str] = None
+
+# Schema para respuesta de operación masiva (con filtro, `results` sólo
+# incluye los IDs que no tuvieron éxito)
+class BulkOperationResponse(BaseModel):
+    processed: int
+    succeeded: int
+    results: List[BulkItemResult]
+
+# Schema para introspección de tokens en lote (servicios internos)
+class TokenIntrospectionRequest(BaseModel):
+    tokens: List[str] = Field(
+        min_length=1, max_length=100, description="Tokens JWT a comprobar"
+    )
+
+# Schema para el resultado de cada token
+class TokenIntrospectionItem(BaseModel):
+    active: bool
+    user_id: Optional[int] = None
+    role: Optional[str] = None
+    email_confirmed: Optional[bool] = None
+    expires_at: Optional[datetime] = None
+
+# Schema para respuesta de introspección (mismo orden que la petición)
+class TokenIntrospectionResponse(BaseModel):
+    results: List[TokenIntrospectionItem]
+
+# Schema para buscar varios usuarios por ID (campos de UserResponse proyectables)
+class UserBatchRequest(BaseModel):
+    user_ids: List[int] = Field(
+        min_length=1, max_length=1000, description="IDs de usuario"
+    )
+    fields: Optional[List[Literal[
+        "id", "name", "last_name", "email", "role",
+        "email_confirmed", "created_at", "updated_at",
+    ]]] = Field(None, description="Campos a devolver (por defecto todos)")
+
+# Schema para respuesta de búsqueda por IDs: id -> datos del usuario
+class UserBatchResponse(BaseModel):
+    users: Dict[int, dict]
+    missing: List[int]
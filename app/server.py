@@ -0,0 +1,161 @@
+# app/server.py
+"""Punto de entrada de producción con varios workers.
+
+Uso:
+    python -m app.server
+    WEB_CONCURRENCY=4 python -m app.server --port 8000
+
+Si gunicorn está instalado se usa como gestor de procesos con workers de
+uvicorn y la aplicación se precarga antes del fork. Si no, se usa el gestor
+multiproceso de uvicorn (sin precarga).
+"""
+import argparse
+import os
+
+APP_MODULE = "app.main:app"
+
+
+def available_cpus() -> int:
+    """Número de CPUs que realmente puede usar este proceso (afinidad y cgroups)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # No disponible fuera de Linux
+        cpus = os.cpu_count() or 1
+
+    # Respetar la cuota de CPU de contenedores (cgroup v2)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def default_workers() -> int:
+    """Workers por defecto: uno por núcleo disponible (sobrescribible con WEB_CONCURRENCY)"""
+    env_value = os.getenv("WEB_CONCURRENCY")
+    if env_value:
+        return max(1, int(env_value))
+    return available_cpus()
+
+
+def configure_threadpool() -> int:
+    """Ajustar el threadpool de anyio al tamaño del pool de conexiones.
+
+    Las rutas síncronas se ejecutan en el threadpool; con más hilos que
+    conexiones los hilos sobrantes sólo esperan en el pool de SQLAlchemy.
+    Debe llamarse dentro del event loop (evento de startup).
+    """
+    from anyio import to_thread
+
+    from .models.database import pool_capacity
+
+    threads = int(os.getenv("THREADPOOL_SIZE", str(pool_capacity())))
+    to_thread.current_default_thread_limiter().total_tokens = max(1, threads)
+    return threads
+
+
+def _post_fork(server, worker):
+    """Descartar las conexiones heredadas del proceso padre tras el fork"""
+    from .models.database import engine
+
+    # close=False: no cerrar los sockets del padre, sólo olvidarlos
+    engine.dispose(close=False)
+
+
+def _run_gunicorn(args) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornApp(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from .main import app
+
+            return app
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        # Importar la app una sola vez en el master (seguro porque post_fork
+        # descarta las conexiones abiertas antes del fork)
+        "preload_app": args.preload,
+        "post_fork": _post_fork,
+        # SIGTERM: apagado ordenado; SIGHUP: recarga de workers sin cortar tráfico
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": 5,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10 if args.max_requests else 0,
+        "accesslog": "-" if args.access_log else None,
+    }
+    GunicornApp(options).run()
+
+
+def _run_uvicorn(args) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP_MODULE,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        access_log=args.access_log,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de producción")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument(
+        "--no-preload", dest="preload", action="store_false",
+        help="No precargar la app en el proceso master",
+    )
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument(
+        "--max-requests", type=int, default=0,
+        help="Reciclar cada worker tras N peticiones (0 = nunca)",
+    )
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument(
+        "--server", choices=["auto", "gunicorn", "uvicorn"], default="auto"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    server = args.server
+
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+
+            server = "gunicorn"
+        except ImportError:
+            server = "uvicorn"
+
+    print(f"Iniciando {server} con {args.workers} worker(s) en {args.host}:{args.port}")
+    if server == "gunicorn":
+        _run_gunicorn(args)
+    else:
+        _run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Registro diferido (write-behind) de last_login y last_seen_at.
+
+Cada login y cada petición autenticada sólo anotan la marca de tiempo en un
+buffer en memoria, fusionado por usuario (se queda la más reciente). Un hilo
+vuelca el buffer cada ACTIVITY_FLUSH_SECONDS con un único UPDATE por lote:
+
+    UPDATE users SET last_login = CASE id WHEN ... END,
+                     last_seen_at = CASE id WHEN ... END
+    WHERE id IN (...)
+
+El buffer se vacía también al apagar la aplicación. Si el proceso muere sin
+apagarse se pierden como mucho ACTIVITY_FLUSH_SECONDS de actividad.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from ..models.database import SessionLocal
+from ..models.usuario import User
+from ..utils.metrics import metrics
+
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "10"))
+ACTIVITY_CHUNK_SIZE = int(os.getenv("ACTIVITY_CHUNK_SIZE", "500"))
+# Con más usuarios pendientes se adelanta el volcado
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "5000"))
+
+FIELDS = ("last_login", "last_seen_at")
+
+
+class ActivityBuffer:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        chunk_size: int = ACTIVITY_CHUNK_SIZE,
+        max_pending: int = ACTIVITY_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, Dict[str, datetime]] = {}
+        # Avisa al hilo de volcado cuando el buffer se llena
+        self.full = threading.Event()
+
+    def _record(self, user_id: int, values: Dict[str, datetime]) -> None:
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {})
+            for field, value in values.items():
+                if field not in entry or entry[field] < value:
+                    entry[field] = value
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self.full.set()
+
+    def record_login(self, user_id: int, when: Optional[datetime] = None) -> None:
+        when = when or datetime.utcnow()
+        self._record(user_id, {"last_login": when, "last_seen_at": when})
+
+    def record_seen(self, user_id: int, when: Optional[datetime] = None) -> None:
+        self._record(user_id, {"last_seen_at": when or datetime.utcnow()})
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Escribir lo pendiente; devuelve el número de usuarios actualizados"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            self.full.clear()
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            user_ids = list(batch)
+            written = 0
+            db = self.session_factory()
+            try:
+                for start in range(0, len(user_ids), self.chunk_size):
+                    chunk = user_ids[start:start + self.chunk_size]
+                    db.execute(self._update_for(chunk, batch))
+                    db.commit()
+                    written += len(chunk)
+            except Exception as e:
+                db.rollback()
+                # Devolver al buffer lo que no se llegó a escribir
+                for user_id in user_ids[written:]:
+                    self._record(user_id, batch[user_id])
+                metrics.inc("activity.flush_errors")
+                print(f"Error volcando actividad de usuarios: {e}")
+            finally:
+                db.close()
+
+            metrics.inc("activity.users_flushed", written)
+            metrics.observe("activity.flush_ms", (time.perf_counter() - started) * 1000)
+            metrics.set_gauge("activity.pending", self.pending)
+            return written
+
+    @staticmethod
+    def _update_for(chunk, batch):
+        values = {}
+        for field in FIELDS:
+            column = getattr(User, field)
+            whens = {
+                user_id: batch[user_id][field]
+                for user_id in chunk
+                if field in batch[user_id]
+            }
+            if whens:
+                values[field] = case(whens, value=User.id, else_=column)
+        # Sin esto el onupdate de updated_at marcaría la fila como modificada
+        values["updated_at"] = User.updated_at
+        return update(User).where(User.id.in_(chunk)).values(**values)
+
+
+class ActivityFlushThread(threading.Thread):
+    """Hilo que vuelca el buffer periódicamente o cuando se llena"""
+
+    def __init__(self, buffer: ActivityBuffer, interval_seconds: float):
+        super().__init__(name="activity-flush", daemon=True)
+        self.buffer = buffer
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.buffer.full.wait(self.interval_seconds)
+            if self._stop_event.is_set():
+                break
+            self.buffer.flush()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.buffer.full.set()
+        self.join()
+        # Vaciado final al apagar
+        self.buffer.flush()
+
+
+# Buffer compartido por todas las peticiones del proceso
+activity_tracker = ActivityBuffer()
+
+_flush_thread: Optional[ActivityFlushThread] = None
+
+
+def start_activity_flusher() -> ActivityFlushThread:
+    global _flush_thread
+    if _flush_thread is None:
+        _flush_thread = ActivityFlushThread(activity_tracker, ACTIVITY_FLUSH_SECONDS)
+        _flush_thread.start()
+    return _flush_thread
+
+
+def stop_activity_flusher() -> None:
+    """Detener el hilo y escribir lo que quede en el buffer"""
+    global _flush_thread
+    if _flush_thread is not None:
+        _flush_thread.stop()
+        _flush_thread = None
+    else:
+        activity_tracker.flush()
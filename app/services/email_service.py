@@ -1,9 +1,34 @@
 import smtplib
+import threading
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from jinja2 import Template
 
+from ..utils.circuit_breaker import CircuitBreaker
+from ..utils.deadline import deadline_expired, remaining
+from ..utils.metrics import metrics
+from ..utils.tracing import start_span
+
+# Tiempos máximos: conexión TCP y cada operación posterior (TLS, login, envío)
+SMTP_CONNECT_TIMEOUT = float(os.getenv("SMTP_CONNECT_TIMEOUT", "5"))
+SMTP_SEND_TIMEOUT = float(os.getenv("SMTP_SEND_TIMEOUT", "10"))
+
+# Reintentos de los envíos aplazados (circuito abierto o envío fallido)
+EMAIL_RETRY_MAX_QUEUE = int(os.getenv("EMAIL_RETRY_MAX_QUEUE", "1000"))
+EMAIL_RETRY_MAX_ATTEMPTS = int(os.getenv("EMAIL_RETRY_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_INTERVAL_SECONDS = float(os.getenv("EMAIL_RETRY_INTERVAL_SECONDS", "5"))
+
+# Compartido por todas las instancias de EmailService del proceso
+smtp_breaker = CircuitBreaker(
+    "smtp",
+    failure_rate=float(os.getenv("SMTP_BREAKER_FAILURE_RATE", "0.5")),
+    window=int(os.getenv("SMTP_BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("SMTP_BREAKER_MIN_CALLS", "3")),
+    open_seconds=float(os.getenv("SMTP_BREAKER_OPEN_SECONDS", "30")),
+)
+
 
 class EmailService:
     def __init__(self):
@@ -16,31 +41,61 @@ class EmailService:
         self.frontend_url = os.getenv("FRONTEND_URL", "")
 
     def send_email(self, to_email: str, subject: str, html_content: str) -> bool:
-        """Enviar email usando SMTP"""
-        try:
-            # Crear mensaje
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.app_name} <{self.from_email}>"
-            message["To"] = to_email
-
-            # Agregar contenido HTML
-            html_part = MIMEText(html_content, "html")
-            message.attach(html_part)
-
-            # Conectar y enviar
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(message)
-
-            print(f"Email enviado exitosamente a {to_email}")
+        """Enviar email usando SMTP.
+
+        Con el circuito abierto, o si el envío falla, el email se aplaza a la
+        cola de reintentos. Devuelve False sólo si no se pudo ni enviar ni
+        aplazar (cola llena).
+        """
+        # Crear mensaje
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.app_name} <{self.from_email}>"
+        message["To"] = to_email
+
+        # Agregar contenido HTML
+        html_part = MIMEText(html_content, "html")
+        message.attach(html_part)
+
+        # Sin plazo restante en la petición no se intenta: se aplaza
+        if deadline_expired() or not smtp_breaker.allow():
+            return email_retry_queue.defer(to_email, message)
+        if self.deliver(to_email, message):
             return True
+        return email_retry_queue.defer(to_email, message, attempts=1)
 
+    def deliver(self, to_email: str, message) -> bool:
+        """Un intento de envío; registra el resultado en el circuit breaker"""
+        connect_timeout = remaining(SMTP_CONNECT_TIMEOUT)
+        send_timeout = SMTP_SEND_TIMEOUT
+        try:
+            with start_span("smtp.send", kind=3, **{"smtp.server": self.smtp_server}):
+                with smtplib.SMTP(timeout=connect_timeout) as server:
+                    server.connect(self.smtp_server, self.smtp_port)
+                    send_timeout = remaining(SMTP_SEND_TIMEOUT)
+                    server.sock.settimeout(send_timeout)
+                    server.starttls()
+                    server.login(self.smtp_username, self.smtp_password)
+                    server.send_message(message)
         except Exception as e:
+            metrics.inc("email.failed")
             print(f"Error enviando email a {to_email}: {e}")
+            # Un timeout recortado por el plazo de la petición no dice nada
+            # de la salud del servidor SMTP: no cuenta como fallo del circuito
+            if isinstance(e, TimeoutError) and (
+                connect_timeout < SMTP_CONNECT_TIMEOUT or send_timeout < SMTP_SEND_TIMEOUT
+            ):
+                metrics.inc("email.deadline_timeouts")
+                smtp_breaker.record_ignored()
+            else:
+                smtp_breaker.record_failure()
             return False
 
+        smtp_breaker.record_success()
+        metrics.inc("email.sent")
+        print(f"Email enviado exitosamente a {to_email}")
+        return True
+
     def send_confirmation_email(
         self, to_email: str, username: str, confirmation_token: str
     ) -> bool:
@@ -158,3 +213,80 @@ class EmailService:
 
         subject = f"¡Bienvenido a {self.app_name}! - Cuenta confirmada"
         return self.send_email(to_email, subject, html_content)
+
+
+class EmailRetryQueue:
+    """Cola acotada de emails aplazados, reintentados desde un hilo"""
+
+    def __init__(
+        self,
+        max_size: int = EMAIL_RETRY_MAX_QUEUE,
+        max_attempts: int = EMAIL_RETRY_MAX_ATTEMPTS,
+        interval_seconds: float = EMAIL_RETRY_INTERVAL_SECONDS,
+    ):
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.interval_seconds = interval_seconds
+        self._items: deque = deque()  # (to_email, message, intentos)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def defer(self, to_email: str, message, attempts: int = 0) -> bool:
+        with self._lock:
+            if len(self._items) >= self.max_size:
+                metrics.inc("email.dropped")
+                print(f"Cola de reintentos llena; se descarta el email a {to_email}")
+                return False
+            self._items.append((to_email, message, attempts))
+            metrics.set_gauge("email.retry_queue", len(self._items))
+            if self._thread is None:
+                # Se arranca al primer uso (ya dentro del proceso worker)
+                self._thread = threading.Thread(
+                    target=self._run, name="email-retry", daemon=True
+                )
+                self._thread.start()
+        metrics.inc("email.deferred")
+        return True
+
+    def _run(self) -> None:
+        service = EmailService()
+        while not self._stopped.wait(self.interval_seconds):
+            self.drain(service)
+
+    def drain(self, service: "EmailService") -> int:
+        """Reintentar en orden mientras el circuito lo permita"""
+        sent = 0
+        while not self._stopped.is_set():
+            with self._lock:
+                if not self._items:
+                    break
+                to_email, message, attempts = self._items.popleft()
+            if not smtp_breaker.allow():
+                # Circuito abierto: se devuelve a la cola sin contar el intento
+                with self._lock:
+                    self._items.appendleft((to_email, message, attempts))
+                break
+            if service.deliver(to_email, message):
+                sent += 1
+                continue
+            with self._lock:
+                if attempts + 1 >= self.max_attempts:
+                    metrics.inc("email.dropped")
+                    print(f"Se descarta el email a {to_email} tras {attempts + 1} intentos")
+                else:
+                    self._items.appendleft((to_email, message, attempts + 1))
+            break
+        metrics.set_gauge("email.retry_queue", len(self._items))
+        return sent
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        if self._items:
+            print(f"{len(self._items)} emails pendientes de reintento se descartan al apagar")
+
+
+email_retry_queue = EmailRetryQueue()
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.database import SessionLocal
+from ..models.usuario import User, UserRole
+
+# Cada cuánto se recalcula la foto completa con GROUP BY (segundos)
+USER_STATS_REFRESH_SECONDS = float(os.getenv("USER_STATS_REFRESH_SECONDS", "300"))
+
+
+class UserStatsCache:
+    """Contadores de usuarios servidos desde memoria.
+
+    Se cargan con un único GROUP BY (rol, confirmado, día de creación) y se
+    mantienen al día con los incrementos que hacen las rutas de escritura del
+    controlador. La foto se recalcula cada USER_STATS_REFRESH_SECONDS para
+    corregir la deriva (otros workers, operaciones masivas, barridos).
+
+    Sólo la primera carga se hace en la petición. Después, una foto caducada
+    o invalidada se sigue sirviendo mientras un único hilo en segundo plano
+    la recalcula con su propia sesión.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float = USER_STATS_REFRESH_SECONDS,
+        session_factory=SessionLocal,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._refreshed_at: Optional[float] = None
+        self._by_role: Counter = Counter()
+        self._by_confirmed: Counter = Counter()
+        self._by_day: Counter = Counter()
+
+    def refresh(self, db: Session) -> None:
+        """Recalcular todos los contadores con un único GROUP BY"""
+        day = func.date(User.created_at)
+        rows = (
+            db.query(User.role, User.email_confirmed, day, func.count(User.id))
+            .group_by(User.role, User.email_confirmed, day)
+            .all()
+        )
+
+        by_role, by_confirmed, by_day = Counter(), Counter(), Counter()
+        for role, confirmed, created_day, count in rows:
+            by_role[role.value if role else UserRole.CLIENT.value] += count
+            by_confirmed[bool(confirmed)] += count
+            if created_day is not None:
+                by_day[str(created_day)[:10]] += count
+
+        with self._lock:
+            self._by_role, self._by_confirmed, self._by_day = by_role, by_confirmed, by_day
+            self._loaded = True
+            self._refreshed_at = time.time()
+
+    def ensure_fresh(self, db: Session) -> None:
+        """Cargar la foto si no existe; si está caducada, recalcularla en segundo plano"""
+        if self._loaded:
+            if time.time() - self._refreshed_at >= self.refresh_seconds:
+                self._refresh_in_background()
+            return
+        # Primera carga: no hay foto que servir, un hilo la calcula y el resto espera
+        with self._refresh_lock:
+            if not self._loaded:
+                self.refresh(db)
+
+    def _refresh_in_background(self) -> None:
+        # Un solo recálculo a la vez; el lock lo libera el propio hilo
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(
+                target=self._background_refresh, name="user-stats-refresh", daemon=True
+            ).start()
+        except Exception:
+            self._refresh_lock.release()
+            raise
+
+    def _background_refresh(self) -> None:
+        db = self.session_factory()
+        try:
+            self.refresh(db)
+        except Exception as e:
+            print(f"Error recalculando estadísticas de usuarios: {e}")
+        finally:
+            db.close()
+            self._refresh_lock.release()
+
+    def invalidate(self) -> None:
+        """Forzar un recálculo en la próxima lectura (escrituras masivas)"""
+        with self._lock:
+            self._refreshed_at = 0.0
+
+    def record_created(self, user: User) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            self._by_role[user.role.value] += 1
+            self._by_confirmed[bool(user.email_confirmed)] += 1
+            self._by_day[(user.created_at or datetime.utcnow()).date().isoformat()] += 1
+
+    def record_confirmed(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            self._by_confirmed[False] -= 1
+            self._by_confirmed[True] += 1
+
+    def record_role_changed(self, old_role: UserRole, new_role: UserRole) -> None:
+        with self._lock:
+            if not self._loaded or old_role == new_role:
+                return
+            self._by_role[old_role.value] -= 1
+            self._by_role[new_role.value] += 1
+
+    def record_deleted(self, user: User) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            self._by_role[user.role.value] -= 1
+            self._by_confirmed[bool(user.email_confirmed)] -= 1
+            if user.created_at:
+                self._by_day[user.created_at.date().isoformat()] -= 1
+
+    def snapshot(self) -> dict:
+        """Contadores actuales, agrupados por rol, confirmación y fecha"""
+        with self._lock:
+            by_role = {role.value: max(0, self._by_role[role.value]) for role in UserRole}
+            confirmed = max(0, self._by_confirmed[True])
+            unconfirmed = max(0, self._by_confirmed[False])
+            by_day = dict(self._by_day)
+            refreshed_at = self._refreshed_at
+
+        today = datetime.utcnow().date()
+        cut_7 = (today - timedelta(days=6)).isoformat()
+        cut_30 = (today - timedelta(days=29)).isoformat()
+        created = {"today": 0, "last_7_days": 0, "last_30_days": 0, "by_month": {}}
+        for day, count in by_day.items():
+            if count <= 0:
+                continue
+            if day == today.isoformat():
+                created["today"] += count
+            if day >= cut_7:
+                created["last_7_days"] += count
+            if day >= cut_30:
+                created["last_30_days"] += count
+            month = day[:7]
+            created["by_month"][month] = created["by_month"].get(month, 0) + count
+        created["by_month"] = dict(sorted(created["by_month"].items()))
+
+        return {
+            "total": confirmed + unconfirmed,
+            "by_role": by_role,
+            "by_email_confirmed": {"confirmed": confirmed, "unconfirmed": unconfirmed},
+            "created": created,
+            "refreshed_at": datetime.utcfromtimestamp(refreshed_at) if refreshed_at else None,
+        }
+
+
+# Caché global de estadísticas (por proceso)
+user_stats = UserStatsCache()
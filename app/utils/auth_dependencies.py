@@ -1,14 +1,30 @@
-from fastapi import Depends, HTTPException, status
+import hmac
+import os
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
 from ..models.database import get_db
-from ..models.usuario import User, UserRole
+from ..models.usuario import User
+from ..models.projections import project
+from ..schemas.usuario_schema import UserResponse
+from ..services.activity_service import activity_tracker
 from ..utils.security import extract_user_from_token
+from ..utils.permissions import ROLE_PERMISSIONS, Permission
 
 # Configurar Bearer Token
 security = HTTPBearer()
 
+# Claves de los servicios internos: "nombre:clave,nombre:clave"
+SERVICE_API_KEYS = [
+    tuple(entry.split(":", 1)) if ":" in entry else ("service", entry)
+    for entry in (item.strip() for item in os.getenv("SERVICE_API_KEYS", "").split(","))
+    if entry
+]
+
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -34,8 +50,13 @@ def get_current_user(
 
     print(f"Token data extraída: {token_data}")  # Debug
 
-    # Buscar usuario en base de datos
-    user = db.query(User).filter(User.id == token_data["user_id"]).first()
+    # Buscar usuario en base de datos (sólo las columnas de UserResponse)
+    user = (
+        db.query(User)
+        .options(project(UserResponse))
+        .filter(User.id == token_data["user_id"])
+        .first()
+    )
     if user is None:
         print(f"Usuario no encontrado con ID: {token_data['user_id']}")  # Debug
         raise credentials_exception
@@ -49,6 +70,7 @@ def get_current_user(
             detail="Debes confirmar tu email antes de acceder"
         )
 
+    activity_tracker.record_seen(user.id)
     return user
 
 
@@ -64,57 +86,76 @@ def get_current_active_user(
     return current_user
 
 
-def require_admin(
-    current_user: User = Depends(get_current_active_user),
-) -> User:
-    """Requerir permisos de administrador"""
-    if current_user.role != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Permisos insuficientes. Se requiere rol de administrador",
-        )
-    return current_user
-
+@lru_cache(maxsize=None)
+def require_permission(
+    required: Permission,
+    own: Optional[Permission] = None,
+    owner_param: str = "user_id",
+):
+    """Dependencia que exige `required`, o `own` si el recurso es del usuario.
 
-def require_role(required_role: UserRole):
-    """Factory para crear dependencia que requiere un rol específico"""
+    El dueño se toma del parámetro de ruta `owner_param`. La dependencia se
+    crea una sola vez por combinación de argumentos.
+    """
+    required_mask = int(required)
+    own_mask = int(own) if own is not None else 0
 
-    def role_checker(
+    def permission_checker(
+        request: Request,
         current_user: User = Depends(get_current_active_user),
     ) -> User:
-        if current_user.role != required_role:
+        granted = ROLE_PERMISSIONS.get(current_user.role, 0)
+        if granted & required_mask == required_mask:
+            return current_user
+        if own_mask and granted & own_mask == own_mask:
+            try:
+                if int(request.path_params[owner_param]) == current_user.id:
+                    return current_user
+            except (KeyError, ValueError):
+                pass
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Permisos insuficientes. Se requiere rol: {required_role.value}",
+                detail="Solo puedes acceder a tu propia información o ser administrador",
             )
-        return current_user
-
-    return role_checker
-
-
-def require_admin_or_artist(
-    current_user: User = Depends(get_current_active_user),
-) -> User:
-    """Requerir rol de admin o artist"""
-    if current_user.role not in [UserRole.ADMIN, UserRole.ARTIST]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Permisos insuficientes. Se requiere rol de administrador o artista",
+            detail="Permisos insuficientes para esta operación",
         )
-    return current_user
 
+    return permission_checker
 
-def require_admin_or_self(user_id: int):
-    """Factory para verificar que sea admin o el mismo usuario"""
-    
-    def admin_or_self_checker(
-        current_user: User = Depends(get_current_active_user),
-    ) -> User:
-        if current_user.role != UserRole.ADMIN and current_user.id != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Solo puedes acceder a tu propia información o ser administrador",
-            )
-        return current_user
 
-    return admin_or_self_checker
\ No newline at end of file
+# Dependencias precompiladas al importar; las rutas usan estas directamente
+require_own_user = require_permission(Permission.READ_OWN_USER)
+require_change_own_password = require_permission(Permission.CHANGE_OWN_PASSWORD)
+require_list_users = require_permission(Permission.LIST_USERS)
+require_view_stats = require_permission(Permission.VIEW_STATS)
+require_manage_roles = require_permission(Permission.MANAGE_ROLES)
+require_delete_users = require_permission(Permission.DELETE_USERS)
+require_admin_or_self = require_permission(
+    Permission.READ_ANY_USER, own=Permission.READ_OWN_USER
+)
+
+
+def require_service(
+    x_service_token: Optional[str] = Header(None),
+) -> str:
+    """Autenticar a un servicio interno por X-Service-Token; devuelve su nombre"""
+    if not SERVICE_API_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No hay servicios internos configurados (SERVICE_API_KEYS)",
+        )
+    if x_service_token:
+        provided = x_service_token.encode("utf-8")
+        # Se comparan todas las claves para no revelar cuál coincide por tiempo
+        matched = None
+        for name, key in SERVICE_API_KEYS:
+            if hmac.compare_digest(provided, key.encode("utf-8")):
+                matched = name
+        if matched is not None:
+            return matched
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token de servicio inválido",
+    )
@@ -0,0 +1,177 @@
+"""Compartimentos (bulkheads) de concurrencia por tipo de ruta.
+
+Cada clase de ruta (hashing, db_read, db_write, email) tiene su propio
+límite de peticiones simultáneas y su propia cola acotada. Así una avalancha
+de /login (bcrypt) no ocupa todos los hilos del threadpool y deja sin
+servicio las lecturas baratas.
+
+Por defecto la suma de las concurrencias es igual al tamaño del pool de
+conexiones (que es también el del threadpool, ver server.configure_threadpool),
+de modo que ninguna clase puede dejar sin hilos a las demás. bcrypt no escala
+más allá del número de CPUs, así que hashing queda limitado a ellas.
+
+Una petición se rechaza con 503 (Retry-After) si la cola está llena, si la
+espera estimada supera el plazo de su clase o si el plazo vence esperando.
+
+Configuración por entorno: BULKHEAD_<CLASE>=concurrencia,cola,espera_segundos
+(por ejemplo BULKHEAD_HASHING=4,32,2).
+
+Las rutas con una sola clase usan la dependencia bulkhead(nombre). Las que
+pasan por varias fases (register: bcrypt y después SMTP) ocupan cada
+compartimento sólo durante su fase con `async with bulkheads[...].slot()`.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+
+from ..models.database import pool_capacity
+from .deadline import remaining
+from .metrics import metrics
+
+# Plazo máximo de espera en cola por clase (segundos)
+BULKHEAD_MAX_WAIT = {
+    "hashing": 2.0,
+    "db_read": 1.0,
+    "db_write": 2.0,
+    "email": 5.0,
+}
+# Tamaño de la cola respecto a la concurrencia
+BULKHEAD_QUEUE_FACTOR = 8
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait_seconds: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self._waiters: deque = deque()
+        # Media móvil del tiempo de servicio, para estimar la espera
+        self._service_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _shed(self, reason: str) -> HTTPException:
+        metrics.inc(f"bulkhead.{self.name}.shed")
+        metrics.inc(f"bulkhead.{self.name}.shed.{reason}")
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio saturado, intenta de nuevo en unos segundos",
+            headers={"Retry-After": str(max(1, int(self.max_wait_seconds)))},
+        )
+
+    def _report(self) -> None:
+        metrics.set_gauge(f"bulkhead.{self.name}.active", self.active)
+        metrics.set_gauge(f"bulkhead.{self.name}.queued", self.queued)
+
+    async def acquire(self, max_wait_seconds: float = None) -> float:
+        """Ocupar un hueco; devuelve el tiempo de espera en segundos"""
+        max_wait = self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._report()
+            metrics.observe(f"bulkhead.{self.name}.wait_ms", 0.0)
+            return 0.0
+
+        if self.queued >= self.max_queue:
+            raise self._shed("queue_full")
+
+        # Rechazo temprano: la espera estimada ya supera el plazo
+        estimated = (self.queued + 1) * self._service_seconds / self.max_concurrent
+        if estimated > max_wait:
+            raise self._shed("deadline")
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._report()
+        try:
+            await asyncio.wait_for(waiter, max_wait)
+        except asyncio.TimeoutError:
+            raise self._shed("timeout")
+        except BaseException:
+            # Cancelada después de recibir el hueco: devolverlo
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._report()
+
+        waited = time.perf_counter() - started
+        metrics.observe(f"bulkhead.{self.name}.wait_ms", waited * 1000)
+        return waited
+
+    def release(self, service_seconds: float = None) -> None:
+        """Liberar el hueco, pasándolo directamente al siguiente en la cola"""
+        if service_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ocupar un hueco durante el bloque; la espera no supera el plazo de la petición"""
+        await self.acquire(remaining(self.max_wait_seconds))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+
+def default_concurrency(capacity: int) -> dict:
+    """Repartir la capacidad entre las clases; db_read se queda el resto"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    hashing = max(1, min(cpus, capacity // 4))
+    email = max(1, capacity // 5)
+    db_write = max(1, capacity // 4)
+    db_read = max(1, capacity - hashing - email - db_write)
+    return {"hashing": hashing, "db_read": db_read, "db_write": db_write, "email": email}
+
+
+def _load_bulkheads() -> dict:
+    bulkheads = {}
+    for name, concurrency in default_concurrency(pool_capacity()).items():
+        queue_size = concurrency * BULKHEAD_QUEUE_FACTOR
+        wait = BULKHEAD_MAX_WAIT[name]
+        value = os.getenv(f"BULKHEAD_{name.upper()}")
+        if value:
+            concurrency, queue_size, wait = value.split(",")
+        bulkheads[name] = Bulkhead(name, int(concurrency), int(queue_size), float(wait))
+    return bulkheads
+
+
+bulkheads = _load_bulkheads()
+
+
+def _make_dependency(bulkhead_instance: Bulkhead):
+    async def bulkhead_slot():
+        async with bulkhead_instance.slot():
+            yield
+
+    bulkhead_slot.__name__ = f"bulkhead_{bulkhead_instance.name}"
+    return bulkhead_slot
+
+
+# Una dependencia por clase, creada una sola vez
+_dependencies = {name: _make_dependency(b) for name, b in bulkheads.items()}
+
+
+def bulkhead(name: str):
+    """Dependencia de FastAPI que ejecuta la ruta dentro del compartimento indicado"""
+    return _dependencies[name]
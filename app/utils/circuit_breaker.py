@@ -0,0 +1,118 @@
+"""Circuit breaker para dependencias externas (SMTP).
+
+- closed: las llamadas pasan; se guarda el resultado de las últimas `window`.
+  Si hay al menos `min_calls` y la tasa de fallos llega a `failure_rate`, se
+  abre el circuito.
+- open: las llamadas se rechazan al instante durante `open_seconds`.
+- half_open: pasado ese tiempo se deja pasar una llamada de prueba; si va
+  bien se cierra el circuito y si falla se vuelve a abrir.
+"""
+import threading
+import time
+from collections import deque
+
+from .metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Valor numérico del estado para la métrica circuit.<nombre>.state
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._results: deque = deque(maxlen=window)  # True = fallo
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        metrics.set_gauge(f"circuit.{name}.state", _STATE_GAUGE[CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    @property
+    def failure_rate(self) -> float:
+        results = list(self._results)
+        return sum(results) / len(results) if results else 0.0
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        metrics.set_gauge(f"circuit.{self.name}.state", _STATE_GAUGE[state])
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            metrics.inc(f"circuit.{self.name}.opened")
+            print(f"Circuito '{self.name}' abierto (tasa de fallos {self.failure_rate:.0%})")
+        elif state == CLOSED:
+            self._results.clear()
+            print(f"Circuito '{self.name}' cerrado")
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+
+    def allow(self) -> bool:
+        """¿Se puede intentar la llamada ahora?"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+        metrics.inc(f"circuit.{self.name}.rejected")
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._set_state(CLOSED)
+            else:
+                self._results.append(False)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._set_state(OPEN)
+                return
+            self._results.append(True)
+            if (
+                self._state == CLOSED
+                and len(self._results) >= self.min_calls
+                and self.failure_rate >= self.failure_rate_threshold
+            ):
+                self._set_state(OPEN)
+
+    def record_ignored(self) -> None:
+        """Llamada sin resultado útil: no cuenta, pero libera la prueba de half_open"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def snapshot(self) -> dict:
+        state = self.state
+        data = {"state": state, "failure_rate": round(self.failure_rate, 3)}
+        if state == OPEN:
+            data["retry_in_seconds"] = round(
+                max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1
+            )
+        return data
@@ -0,0 +1,213 @@
+"""Plazo máximo (deadline) por petición.
+
+- DeadlineMiddleware abre un plazo de REQUEST_TIMEOUT_SECONDS para cada
+  petición HTTP; cada ruta puede fijar el suyo (más corto o más largo) con la
+  dependencia request_budget(segundos), contado desde el inicio de la
+  petición.
+- El plazo restante se aplica a lo que hace la petición:
+  * MySQL: hint /*+ MAX_EXECUTION_TIME(ms) */ en cada SELECT.
+  * SQLite: progress handler que interrumpe la consulta en curso.
+  * Antes de cada sentencia: si el plazo venció, no se ejecuta.
+  * SMTP y esperas en los bulkheads: su timeout nunca supera lo que queda.
+- Si el plazo vence antes de empezar la respuesta se devuelve 504 y la
+  petición se marca como abandonada: el trabajo que siga en un hilo se corta
+  en la siguiente sentencia SQL o comprobación del plazo.
+"""
+import asyncio
+import json
+import os
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from .metrics import metrics
+
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "10"))
+# Cada cuánto revisa el middleware si el plazo (quizá cambiado por la ruta) venció
+DEADLINE_POLL_SECONDS = 0.25
+# Instrucciones de la VM de SQLite entre comprobaciones del plazo
+SQLITE_PROGRESS_STEPS = 1000
+# Error de MySQL al superar MAX_EXECUTION_TIME
+MYSQL_QUERY_TIMEOUT_ERRNO = 3024
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="La petición superó su tiempo máximo",
+        )
+
+
+class Deadline:
+    __slots__ = ("started_at", "expires_at", "abandoned")
+
+    def __init__(self, seconds: float):
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        self.abandoned = False
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.abandoned or time.monotonic() >= self.expires_at
+
+    def set_budget(self, seconds: float) -> None:
+        self.expires_at = self.started_at + seconds
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining(default: float) -> float:
+    """Timeout a usar: `default` o lo que quede del plazo, lo que sea menor"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    return min(default, deadline.remaining())
+
+
+def deadline_expired() -> bool:
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired()
+
+
+def check_deadline() -> None:
+    """Lanzar 504 si el plazo de la petición actual ya venció"""
+    if deadline_expired():
+        raise DeadlineExceeded()
+
+
+@lru_cache(maxsize=None)
+def request_budget(seconds: float):
+    """Dependencia que fija el plazo de la ruta en `seconds` desde el inicio"""
+
+    async def budget():
+        deadline = _current_deadline.get()
+        if deadline is not None:
+            deadline.set_budget(seconds)
+
+    budget.__name__ = f"request_budget_{seconds:g}s"
+    return budget
+
+
+class DeadlineMiddleware:
+    """Middleware ASGI que corta las peticiones que superan su plazo"""
+
+    def __init__(self, app, timeout_seconds: float = REQUEST_TIMEOUT_SECONDS):
+        self.app = app
+        self.timeout_seconds = timeout_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.timeout_seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(self.timeout_seconds)
+        response_started = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if deadline.abandoned:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        token = _current_deadline.set(deadline)
+        try:
+            # La tarea copia el contexto, con el plazo ya fijado
+            task = asyncio.ensure_future(self.app(scope, receive, guarded_send))
+        finally:
+            _current_deadline.reset(token)
+
+        while not task.done():
+            if not deadline.expired():
+                await asyncio.wait(
+                    {task}, timeout=min(DEADLINE_POLL_SECONDS, deadline.remaining())
+                )
+            elif response_started:
+                # La respuesta ya empezó: sólo queda dejar que termine
+                await asyncio.wait({task})
+            else:
+                break
+
+        if task.done():
+            await task
+            return
+
+        deadline.abandoned = True
+        metrics.inc("deadline.exceeded")
+        print(f"Plazo vencido: {scope['method']} {scope['path']}; petición abandonada")
+        # No se cancela la tarea: el hilo no se puede interrumpir y la limpieza
+        # de sus dependencias (sesión de DB) debe ejecutarse. Se corta sola en
+        # la siguiente comprobación del plazo y su respuesta se descarta.
+        task.add_done_callback(_discard_result)
+        body = json.dumps({"detail": "La petición superó su tiempo máximo"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_504_GATEWAY_TIMEOUT,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _discard_result(task) -> None:
+    """Recoger la excepción de una petición abandonada para que no se registre"""
+    if not task.cancelled():
+        task.exception()
+
+
+def instrument_deadlines(engine) -> None:
+    """Aplicar el plazo de la petición a las sentencias SQL del engine"""
+    from sqlalchemy import event
+
+    dialect = engine.dialect.name
+
+    def _sqlite_progress() -> int:
+        return 1 if deadline_expired() else 0
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        deadline = _current_deadline.get()
+        if deadline is None:
+            return statement, parameters
+        if deadline.expired():
+            metrics.inc("deadline.statements_skipped")
+            raise DeadlineExceeded()
+
+        if dialect == "mysql":
+            stripped = statement.lstrip()
+            if stripped[:6].upper() == "SELECT":
+                ms = max(1, int(deadline.remaining() * 1000))
+                statement = f"SELECT /*+ MAX_EXECUTION_TIME({ms}) */{stripped[6:]}"
+        elif dialect == "sqlite":
+            record = conn.connection
+            if not record.info.get("deadline_progress_handler"):
+                record.dbapi_connection.set_progress_handler(
+                    _sqlite_progress, SQLITE_PROGRESS_STEPS
+                )
+                record.info["deadline_progress_handler"] = True
+        return statement, parameters
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if not deadline_expired():
+            return None
+        original = context.original_exception
+        errno = original.args[0] if getattr(original, "args", None) else None
+        if errno == MYSQL_QUERY_TIMEOUT_ERRNO or "interrupted" in str(original):
+            metrics.inc("deadline.statements_interrupted")
+            raise DeadlineExceeded() from original
+        return None
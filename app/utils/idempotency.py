@@ -0,0 +1,257 @@
+"""Soporte de la cabecera Idempotency-Key.
+
+La primera petición con una clave se ejecuta normalmente y su respuesta se
+guarda durante IDEMPOTENCY_TTL_SECONDS. Los reintentos con la misma clave
+reciben la respuesta guardada sin repetir el trabajo (bcrypt, escrituras en
+la DB, envío de emails). Si llega un duplicado mientras la primera sigue en
+curso, espera a su resultado en lugar de ejecutarse en paralelo.
+
+El almacén vive en memoria de cada proceso y está acotado (LRU + TTL).
+Limitación: con varios workers (servidor multiproceso) cada uno tiene su
+propio almacén, así que dos duplicados que lleguen a workers distintos no
+se ven entre sí y pueden ejecutarse en paralelo. La garantía es completa
+sólo con un worker o si el balanceador envía la misma clave al mismo
+worker; las rutas cubiertas deben seguir siendo seguras ante un duplicado
+(email único en register, etc.).
+
+El cuerpo de las peticiones con Idempotency-Key se lee entero antes de
+llegar a la ruta, así que se limita a IDEMPOTENCY_MAX_REQUEST_BYTES (413).
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .metrics import metrics
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_MAX_BODY_BYTES = 64 * 1024
+IDEMPOTENCY_MAX_REQUEST_BYTES = int(os.getenv("IDEMPOTENCY_MAX_REQUEST_BYTES", str(64 * 1024)))
+
+# Rutas que aceptan Idempotency-Key
+IDEMPOTENT_PATHS = {
+    "/api/v1/auth/register",
+    "/api/v1/auth/resend-confirmation",
+    "/api/v1/auth/change-password",
+}
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response", "expires_at")
+
+    def __init__(self, fingerprint: str, ttl: float):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.response: Optional[Tuple[int, List, bytes]] = None
+        self.expires_at = time.monotonic() + ttl
+
+
+class IdempotencyStore:
+    """Almacén acotado de respuestas por clave (se usa desde el event loop)"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        excess = len(self._entries) + 1 - self.max_entries
+        expired = []
+        # Desde la menos usada recientemente; las peticiones en curso se saltan
+        # (nunca se expulsan y su número está acotado por la concurrencia)
+        for key, entry in self._entries.items():
+            if not entry.done.is_set():
+                continue
+            if entry.expires_at <= now or excess > 0:
+                expired.append(key)
+                excess -= 1
+            else:
+                break
+        for key in expired:
+            del self._entries[key]
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[_Entry, bool]:
+        """Obtener la entrada de la clave; True si esta petición debe ejecutarse"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic() and entry.done.is_set():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry, False
+
+        self._evict()
+        entry = _Entry(fingerprint, self.ttl_seconds)
+        self._entries[key] = entry
+        return entry, True
+
+    def complete(self, key: str, entry: _Entry, response: Tuple[int, List, bytes]) -> None:
+        entry.response = response
+        entry.expires_at = time.monotonic() + self.ttl_seconds
+        entry.done.set()
+
+    def abort(self, key: str, entry: _Entry) -> None:
+        """Descartar la entrada (error o respuesta no reutilizable)"""
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.done.set()
+
+
+class IdempotencyMiddleware:
+    """Middleware ASGI que aplica Idempotency-Key a IDEMPOTENT_PATHS"""
+
+    def __init__(self, app, store: Optional[IdempotencyStore] = None, paths=None):
+        self.app = app
+        self.store = store or IdempotencyStore()
+        self.paths = set(paths or IDEMPOTENT_PATHS)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        raw_key = headers.get(b"idempotency-key")
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key or len(raw_key) > 255:
+            await _send_json(send, 400, b'{"detail":"Idempotency-Key inv\\u00e1lida"}')
+            return
+
+        # Se rechaza antes de leer si Content-Length ya supera el límite
+        content_length = headers.get(b"content-length", b"")
+        too_large = content_length.isdigit() and int(content_length) > IDEMPOTENCY_MAX_REQUEST_BYTES
+        body = None if too_large else await _read_body(receive, IDEMPOTENCY_MAX_REQUEST_BYTES)
+        if body is None:
+            await _send_json(send, 413, _TOO_LARGE)
+            return
+        authorization = headers.get(b"authorization", b"")
+        # La clave se asocia al usuario (Authorization) y a la ruta
+        key = hashlib.sha256(
+            b"\0".join([scope["path"].encode(), authorization, raw_key])
+        ).hexdigest()
+        fingerprint = hashlib.sha256(scope["method"].encode() + b"\0" + body).hexdigest()
+
+        while True:
+            entry, owner = self.store.begin(key, fingerprint)
+            if owner:
+                break
+
+            if entry.fingerprint != fingerprint:
+                await _send_json(
+                    send, 422,
+                    b'{"detail":"Idempotency-Key ya usada con otra petici\\u00f3n"}',
+                )
+                return
+
+            if not entry.done.is_set():
+                metrics.inc("idempotency.waits")
+                try:
+                    await asyncio.wait_for(entry.done.wait(), IDEMPOTENCY_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    await _send_json(
+                        send, 409,
+                        b'{"detail":"La petici\\u00f3n original sigue en curso"}',
+                    )
+                    return
+
+            if entry.response is not None:
+                metrics.inc("idempotency.replays")
+                status_code, response_headers, response_body = entry.response
+                await send({
+                    "type": "http.response.start",
+                    "status": status_code,
+                    "headers": response_headers + [(b"idempotent-replayed", b"true")],
+                })
+                await send({"type": "http.response.body", "body": response_body})
+                return
+            # La original falló: este reintento la vuelve a ejecutar
+
+        await self._run_and_store(scope, body, receive, send, key, entry)
+
+    async def _run_and_store(self, scope, body, receive, send, key, entry):
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        captured = {"status": 500, "headers": [], "body": bytearray(), "too_big": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                if len(captured["body"]) + len(message.get("body", b"")) > IDEMPOTENCY_MAX_BODY_BYTES:
+                    captured["too_big"] = True
+                else:
+                    captured["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            self.store.abort(key, entry)
+            raise
+
+        # Los errores de servidor no se guardan: el cliente puede reintentar
+        if captured["status"] >= 500 or captured["too_big"]:
+            self.store.abort(key, entry)
+            return
+
+        self.store.complete(
+            key, entry, (captured["status"], captured["headers"], bytes(captured["body"]))
+        )
+        metrics.set_gauge("idempotency.entries", len(self.store))
+
+
+_TOO_LARGE = b'{"detail":"Cuerpo de la petici\\u00f3n demasiado grande"}'
+
+
+async def _read_body(receive, max_bytes: int) -> Optional[bytes]:
+    """Leer el cuerpo completo; None si supera max_bytes"""
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def _send_json(send, status_code: int, body: bytes) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,222 @@
+"""Claves RSA para firmar tokens (RS256) y publicarlas como JWKS.
+
+Con ALGORITHM=RS256 los tokens se firman con una clave privada del
+directorio JWT_KEYS_DIR (un fichero <kid>.pem por clave) y llevan su `kid`
+en la cabecera. Los demás servicios verifican localmente con las claves
+públicas de /.well-known/jwks.json.
+
+Rotación:
+- Cuando la clave más reciente supera JWT_KEY_ROTATION_DAYS se genera otra.
+- Una clave nueva se publica de inmediato pero sólo se usa para firmar
+  cuando lleva publicada más de JWKS_MAX_AGE_SECONDS, para que las cachés
+  de los demás servicios la conozcan antes de ver tokens firmados con ella.
+- Las claves se retiran cuando ya no puede quedar ningún token vigente
+  firmado con ellas (rotación + JWT_KEY_RETIRE_AFTER_DAYS).
+
+Generar una clave RSA con el backend `rsa` (Python puro) tarda segundos,
+así que nunca se hace en el camino de una petición: las claves se crean en
+el arranque y en el hilo KeyRotationThread, cada JWT_KEY_CHECK_SECONDS.
+Un lock de fichero en el directorio garantiza que sólo un worker genere o
+retire claves; el resto relee el directorio y usa las mismas.
+
+Las peticiones sólo leen el anillo ya cargado. Los PEM se parsean una sola
+vez; el directorio se relee al ver un `kid` desconocido (otro worker rotó)
+y antes de publicar el JWKS si han cambiado los ficheros.
+EdDSA no está disponible: python-jose no implementa ese algoritmo.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from jose import jwk
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "keys")
+JWT_KEY_SIZE = int(os.getenv("JWT_KEY_SIZE", "2048"))
+JWT_KEY_ROTATION_DAYS = float(os.getenv("JWT_KEY_ROTATION_DAYS", "30"))
+# Vida máxima de un token (los de login duran 30 días)
+JWT_KEY_RETIRE_AFTER_DAYS = float(os.getenv("JWT_KEY_RETIRE_AFTER_DAYS", "31"))
+JWT_KEY_CHECK_SECONDS = float(os.getenv("JWT_KEY_CHECK_SECONDS", "300"))
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "3600"))
+# Mínimo entre relecturas provocadas por un kid desconocido
+UNKNOWN_KID_RELOAD_SECONDS = 10.0
+
+ASYMMETRIC_ALGORITHMS = {"RS256"}
+KID_FORMAT = "%Y%m%dT%H%M%SZ"
+LOCK_FILENAME = ".rotation.lock"
+
+
+class KeyRing:
+    def __init__(
+        self,
+        directory: str = JWT_KEYS_DIR,
+        algorithm: str = "RS256",
+        rotation_days: float = JWT_KEY_ROTATION_DAYS,
+        retire_after_days: float = JWT_KEY_RETIRE_AFTER_DAYS,
+        publish_delay_seconds: float = JWKS_MAX_AGE_SECONDS,
+    ):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(
+                f"Algoritmo '{algorithm}' no soportado para claves asimétricas "
+                f"({', '.join(sorted(ASYMMETRIC_ALGORITHMS))})"
+            )
+        self.directory = directory
+        self.algorithm = algorithm
+        self.rotation_seconds = rotation_days * 86400
+        self.retire_seconds = (rotation_days + retire_after_days) * 86400
+        self.publish_delay_seconds = publish_delay_seconds
+        self._lock = threading.Lock()
+        # kid -> (creada en, clave privada, clave pública), ya parseadas
+        self._keys: Dict[str, Tuple[float, object, object]] = {}
+        self._jwks: Tuple[bytes, str] = (b'{"keys": []}', "")
+        self._files: List[str] = []
+        self._unknown_kid_at = 0.0
+
+    @staticmethod
+    def _created_at(kid: str) -> float:
+        return datetime.strptime(kid, KID_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+    def refresh(self) -> None:
+        """Leer el directorio, rotar y retirar claves según su antigüedad.
+
+        Se llama en el arranque y desde KeyRotationThread, nunca por petición.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = os.path.join(self.directory, LOCK_FILENAME)
+        with open(lock_path, "a") as lock_file:
+            # Un solo generador entre workers; los demás esperan y releen
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.reload()
+                newest = max((entry[0] for entry in self._keys.values()), default=None)
+                if newest is None or time.time() - newest >= self.rotation_seconds:
+                    self._generate()
+                    self.reload()
+                self._retire()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _key_files(self) -> List[str]:
+        try:
+            return sorted(f for f in os.listdir(self.directory) if f.endswith(".pem"))
+        except FileNotFoundError:
+            return []
+
+    def reload(self) -> None:
+        """Releer las claves del disco (sin generar ninguna)"""
+        with self._lock:
+            self._load(self._key_files())
+
+    def _load(self, filenames: List[str]) -> None:
+        # Se construye un dict nuevo y se sustituye: los lectores no toman el lock
+        keys = {}
+        for filename in filenames:
+            kid = filename[:-4]
+            try:
+                created_at = self._created_at(kid)
+            except ValueError:
+                continue
+            if kid in self._keys:
+                keys[kid] = self._keys[kid]
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                    private_key = jwk.construct(f.read(), self.algorithm)
+            except FileNotFoundError:
+                continue  # retirada entre listdir y open
+            keys[kid] = (created_at, private_key, private_key.public_key())
+        self._keys = keys
+        self._files = filenames
+        self._build_jwks()
+
+    def _generate(self) -> None:
+        import rsa  # dependencia de python-jose
+
+        _, private_key = rsa.newkeys(JWT_KEY_SIZE)
+        kid = datetime.utcnow().strftime(KID_FORMAT)
+        path = os.path.join(self.directory, f"{kid}.pem")
+        # Se escribe en un temporal y se renombra: nadie lee un PEM a medias
+        tmp_path = f"{path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(private_key.save_pkcs1())
+        os.replace(tmp_path, path)
+        print(f"Nueva clave de firma JWT generada: {kid}")
+
+    def _retire(self) -> None:
+        now = time.time()
+        keys = self._keys
+        newest = max(keys, key=lambda kid: keys[kid][0], default=None)
+        retired = False
+        for kid, (created_at, _, _) in keys.items():
+            # La clave más reciente nunca se retira
+            if kid != newest and now - created_at >= self.retire_seconds:
+                try:
+                    os.remove(os.path.join(self.directory, f"{kid}.pem"))
+                    print(f"Clave de firma JWT retirada: {kid}")
+                except FileNotFoundError:
+                    pass  # otro worker ya la retiró
+                retired = True
+        if retired:
+            self.reload()
+
+    def _build_jwks(self) -> None:
+        keys = []
+        for kid, (_, _, public_key) in sorted(self._keys.items()):
+            public = public_key.to_dict()
+            public.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+            keys.append(public)
+        body = json.dumps({"keys": keys}, sort_keys=True).encode("utf-8")
+        self._jwks = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+    def signing_key(self) -> Tuple[str, object]:
+        """Clave más reciente que ya lleva publicada el tiempo de caché del JWKS"""
+        keys = sorted(self._keys.items(), key=lambda item: item[1][0], reverse=True)
+        if not keys:
+            raise RuntimeError("No hay claves de firma cargadas (falta init_signing_keys)")
+        now = time.time()
+        for kid, (created_at, key, _) in keys:
+            if now - created_at >= self.publish_delay_seconds:
+                return kid, key
+        # Sin ninguna clave "madura" (primer arranque): la más reciente
+        kid, (_, key, _) = keys[0]
+        return kid, key
+
+    def verification_key(self, kid: Optional[str]):
+        """Clave pública para un kid, o None si no se conoce"""
+        entry = self._keys.get(kid)
+        if entry is None and time.monotonic() - self._unknown_kid_at >= UNKNOWN_KID_RELOAD_SECONDS:
+            self._unknown_kid_at = time.monotonic()
+            self.reload()
+            entry = self._keys.get(kid)
+        return entry[2] if entry else None
+
+    def jwks(self) -> Tuple[bytes, str]:
+        """Cuerpo JSON del JWKS y su ETag, releyendo el disco si otro worker rotó"""
+        if self._key_files() != self._files:
+            self.reload()
+        return self._jwks
+
+
+class KeyRotationThread(threading.Thread):
+    """Hilo en segundo plano que rota y retira las claves periódicamente"""
+
+    def __init__(self, keyring: KeyRing, interval_seconds: float = JWT_KEY_CHECK_SECONDS):
+        super().__init__(name="jwt-key-rotation", daemon=True)
+        self.keyring = keyring
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self.keyring.refresh()
+            except Exception as e:
+                print(f"Error rotando las claves de firma JWT: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,50 @@
+import threading
+from typing import Dict
+
+
+class MetricsRegistry:
+    """Registro en memoria de contadores, gauges y tiempos (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, dict] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """Incrementar un contador"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Fijar el valor actual de un gauge"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """Registrar una observación (por ejemplo, una duración en ms)"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+            timing["count"] += 1
+            timing["sum"] += value
+            if value > timing["max"]:
+                timing["max"] = value
+
+    def snapshot(self) -> dict:
+        """Copia de todas las métricas actuales"""
+        with self._lock:
+            timings = {
+                name: {**t, "avg": t["sum"] / t["count"] if t["count"] else 0.0}
+                for name, t in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+
+# Registro global de la aplicación
+metrics = MetricsRegistry()
@@ -0,0 +1,49 @@
+# utils/permissions.py
+"""Permisos por rol (RBAC).
+
+La política se declara como rol -> lista de permisos y se compila una sola
+vez, al importar el módulo, en una máscara de bits por rol. Comprobar un
+permiso es un acceso a diccionario y un AND.
+"""
+import enum
+from functools import reduce
+from operator import or_
+from typing import Dict
+
+from ..models.usuario import UserRole
+
+
+class Permission(enum.IntFlag):
+    READ_OWN_USER = enum.auto()
+    READ_ANY_USER = enum.auto()
+    CHANGE_OWN_PASSWORD = enum.auto()
+    LIST_USERS = enum.auto()
+    VIEW_STATS = enum.auto()
+    MANAGE_ROLES = enum.auto()
+    DELETE_USERS = enum.auto()
+    PROFILE_REQUESTS = enum.auto()
+
+
+ALL_PERMISSIONS = reduce(or_, Permission)
+
+# Política declarativa
+ROLE_POLICY = {
+    UserRole.CLIENT: [Permission.READ_OWN_USER, Permission.CHANGE_OWN_PASSWORD],
+    UserRole.ARTIST: [Permission.READ_OWN_USER, Permission.CHANGE_OWN_PASSWORD],
+    UserRole.ADMIN: [ALL_PERMISSIONS],
+}
+
+
+def compile_policy(policy) -> Dict[UserRole, int]:
+    """Convertir la política en una máscara de bits por rol"""
+    return {
+        role: int(reduce(or_, permissions, Permission(0)))
+        for role, permissions in policy.items()
+    }
+
+
+ROLE_PERMISSIONS = compile_policy(ROLE_POLICY)
+
+
+def has_permission(role: UserRole, required: Permission) -> bool:
+    return ROLE_PERMISSIONS.get(role, 0) & required == required
@@ -0,0 +1,344 @@
+"""Perfilado bajo demanda de una petición y fotos de memoria (sólo admins).
+
+- Cabecera `X-Profile: 1` con un token de admin: durante esa petición un
+  hilo muestrea las pilas cada PROFILE_INTERVAL_MS y guarda el resultado en
+  formato "collapsed stacks" (flamegraph.pl, speedscope) en PROFILE_DIR. La
+  respuesta indica el fichero en `X-Profile-File`.
+- `GET /debug/memory`: arranca tracemalloc si no está activo y, si ya lo
+  está, devuelve los principales puntos de asignación (`?top=20`).
+  `?stop=1` detiene tracemalloc; si nadie lo hace, se detiene solo a los
+  MEMORY_TRACE_MAX_SECONDS (el coste de tracemalloc lo paga cada asignación).
+
+Sólo se permite un perfil a la vez y como mucho uno cada
+PROFILE_MIN_INTERVAL_SECONDS; las llamadas a /debug/memory tienen su propio
+límite. Antes de consultar la DB se comprueban, en este orden, que haya un
+token Bearer, el límite de frecuencia y la firma/expiración del token; el
+resultado de la consulta se guarda ADMIN_CHECK_TTL_SECONDS por usuario.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+from urllib.parse import parse_qs
+
+from anyio import to_thread
+
+from ..models.database import SessionLocal
+from ..models.usuario import User
+from .metrics import metrics
+from .permissions import Permission, has_permission
+from .security import extract_user_from_token
+from .tracing import RequestThreads, _request_threads
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+PROFILE_MIN_INTERVAL_SECONDS = float(os.getenv("PROFILE_MIN_INTERVAL_SECONDS", "30"))
+MEMORY_MIN_INTERVAL_SECONDS = float(os.getenv("MEMORY_MIN_INTERVAL_SECONDS", "10"))
+MEMORY_TRACE_MAX_SECONDS = float(os.getenv("MEMORY_TRACE_MAX_SECONDS", "300"))
+MEMORY_SNAPSHOT_PATH = "/debug/memory"
+ADMIN_CHECK_TTL_SECONDS = 60.0
+ADMIN_CHECK_MAX_ENTRIES = 1024
+
+# Funciones donde un hilo está esperando (no aportan al perfil)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class StackSampler(threading.Thread):
+    """Muestreador de las pilas de los hilos de una petición.
+
+    Sólo se muestrean el hilo del event loop y los hilos que, en ese
+    instante, ejecutan código de la petición (anotados en RequestThreads por
+    traced() y por las sentencias SQL); no los de otras peticiones.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float,
+        max_seconds: float,
+        threads: RequestThreads,
+        loop_ident: int,
+    ):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.threads = threads
+        self.loop_ident = loop_ident
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval_seconds):
+            if time.monotonic() > deadline:
+                break
+            wanted = self.threads.snapshot()
+            wanted.add(self.loop_ident)
+            wanted.discard(own_id)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in wanted:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+def _is_admin(user_id: int) -> bool:
+    """Comprobar en la DB que el usuario está confirmado y tiene permiso de perfilado"""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(User.role, User.email_confirmed)
+            .filter(User.id == user_id)
+            .first()
+        )
+    finally:
+        db.close()
+    return (
+        row is not None
+        and bool(row.email_confirmed)
+        and has_permission(row.role, Permission.PROFILE_REQUESTS)
+    )
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI con perfilado por petición y fotos de tracemalloc"""
+
+    def __init__(self, app):
+        self.app = app
+        self._profile_lock = threading.Lock()
+        self._last_profile = 0.0
+        self._last_memory = 0.0
+        # user_id -> (es admin, caduca en)
+        self._admin_cache = {}
+        self._trace_timer: Optional[threading.Timer] = None
+        self._trace_stops_at = 0.0
+        self._trace_auto_stopped = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        wants_profile = headers.get(b"x-profile") in (b"1", b"true")
+        is_memory = scope["path"] == MEMORY_SNAPSHOT_PATH
+        if not wants_profile and not is_memory:
+            await self.app(scope, receive, send)
+            return
+
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+        now = time.monotonic()
+
+        # Comprobaciones sin DB primero: token presente, frecuencia y firma
+        if not token:
+            admin = False
+        elif is_memory and now - self._last_memory < MEMORY_MIN_INTERVAL_SECONDS:
+            await _send_json(send, 429, {"detail": "Demasiadas fotos de memoria; espera unos segundos"})
+            return
+        elif not is_memory and not self._profile_available(now):
+            metrics.inc("profiling.rejected")
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-status", b"rate-limited")]))
+            return
+        else:
+            token_data = extract_user_from_token(token)
+            admin = token_data is not None and await self._check_admin(token_data["user_id"], now)
+
+        if is_memory:
+            if not admin:
+                await _send_json(send, 403, {"detail": "Se requiere rol de administrador"})
+                return
+            await self._memory_snapshot(scope, send)
+            return
+
+        if not admin:
+            # Sin permisos la cabecera se ignora
+            await self.app(scope, receive, send)
+            return
+
+        await self._profile_request(scope, receive, send)
+
+    def _profile_available(self, now: float) -> bool:
+        return (
+            now - self._last_profile >= PROFILE_MIN_INTERVAL_SECONDS
+            and not self._profile_lock.locked()
+        )
+
+    async def _check_admin(self, user_id: int, now: float) -> bool:
+        cached = self._admin_cache.get(user_id)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        admin = await to_thread.run_sync(_is_admin, user_id)
+        if len(self._admin_cache) >= ADMIN_CHECK_MAX_ENTRIES:
+            self._admin_cache.clear()
+        self._admin_cache[user_id] = (admin, now + ADMIN_CHECK_TTL_SECONDS)
+        return admin
+
+    async def _profile_request(self, scope, receive, send):
+        now = time.monotonic()
+        if now - self._last_profile < PROFILE_MIN_INTERVAL_SECONDS or not self._profile_lock.acquire(blocking=False):
+            metrics.inc("profiling.rejected")
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-status", b"rate-limited")]))
+            return
+
+        self._last_profile = now
+        filename = os.path.join(
+            PROFILE_DIR,
+            f"profile-{int(time.time())}-{scope['method']}"
+            f"{scope['path'].replace('/', '_')}.folded",
+        )
+        threads = RequestThreads()
+        sampler = StackSampler(
+            PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS, threads, threading.get_ident()
+        )
+        sampler.start()
+        # Los hilos del threadpool heredan el contexto y se anotan en `threads`
+        token = _request_threads.set(threads)
+        try:
+            await self.app(
+                scope, receive,
+                _with_headers(send, [(b"x-profile-file", filename.encode())]),
+            )
+        finally:
+            _request_threads.reset(token)
+            samples = await to_thread.run_sync(sampler.stop)
+            self._profile_lock.release()
+            await to_thread.run_sync(_write_folded, filename, samples)
+            metrics.inc("profiling.profiles")
+
+    async def _memory_snapshot(self, scope, send):
+        params = parse_qs(scope.get("query_string", b"").decode())
+        now = time.monotonic()
+
+        if params.get("stop") == ["1"]:
+            self._last_memory = now
+            auto_stopped = self._trace_auto_stopped
+            self._stop_tracing()
+            await _send_json(send, 200, {"tracing": False, "auto_stopped": auto_stopped})
+            return
+
+        if not tracemalloc.is_tracing():
+            auto_stopped = self._trace_auto_stopped
+            self._start_tracing(now)
+            self._last_memory = now
+            await _send_json(
+                send, 202,
+                {
+                    "tracing": True,
+                    "detail": "tracemalloc iniciado; vuelve a consultar más tarde",
+                    "auto_stop_in_seconds": MEMORY_TRACE_MAX_SECONDS,
+                    # La traza anterior se detuvo sola al agotar su ventana
+                    "previous_auto_stopped": auto_stopped,
+                },
+            )
+            return
+
+        self._last_memory = now
+
+        try:
+            top = max(1, min(100, int(params.get("top", ["20"])[0])))
+        except ValueError:
+            top = 20
+        result = await to_thread.run_sync(_top_allocations, top)
+        result["auto_stop_in_seconds"] = round(max(0.0, self._trace_stops_at - time.monotonic()), 1)
+        await _send_json(send, 200, result)
+
+    def _start_tracing(self, now: float) -> None:
+        tracemalloc.start()
+        self._trace_auto_stopped = False
+        self._trace_stops_at = now + MEMORY_TRACE_MAX_SECONDS
+        self._trace_timer = threading.Timer(MEMORY_TRACE_MAX_SECONDS, self._auto_stop_tracing)
+        self._trace_timer.daemon = True
+        self._trace_timer.start()
+
+    def _stop_tracing(self) -> None:
+        if self._trace_timer is not None:
+            self._trace_timer.cancel()
+            self._trace_timer = None
+        tracemalloc.stop()
+
+    def _auto_stop_tracing(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._trace_auto_stopped = True
+            metrics.inc("profiling.memory_auto_stopped")
+            print("tracemalloc detenido automáticamente tras MEMORY_TRACE_MAX_SECONDS")
+        self._trace_timer = None
+
+
+def _top_allocations(top: int) -> dict:
+    try:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+    except RuntimeError:
+        # Se detuvo (automáticamente) entre la comprobación y la foto
+        return {"tracing": False, "auto_stopped": True}
+    stats = snapshot.statistics("lineno")
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "top": [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count,
+            }
+            for stat in stats[:top]
+        ],
+    }
+
+
+def _write_folded(filename: str, samples: Counter) -> None:
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def _with_headers(send, extra_headers):
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": list(message.get("headers", [])) + extra_headers}
+        await send(message)
+
+    return wrapped
+
+
+async def _send_json(send, status_code: int, data: Optional[dict]) -> None:
+    body = json.dumps(data, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
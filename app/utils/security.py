@@ -1,14 +1,64 @@
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 import os
 
+from .jwks import ASYMMETRIC_ALGORITHMS, KeyRing, KeyRotationThread
+
 # Configuración JWT
+DEFAULT_SECRET_KEY = "secretkeysecret"
 SECRET_KEY = os.getenv(
-    "SECRET_KEY", "secretkeysecret"
+    "SECRET_KEY", DEFAULT_SECRET_KEY
 )  # En producción usar una clave segura
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE = int(os.getenv("ACCESS_TOKEN_EXPIRE", "30"))
+# Con RS256, aceptar todavía los tokens HS256 emitidos antes del cambio
+# (desactivado por defecto). JWT_ACCEPT_HS256_UNTIL (ISO 8601, UTC) acota la
+# transición: poner la expiración del último token HS256 emitido.
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "false").lower() == "true"
+def _parse_utc(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+JWT_ACCEPT_HS256_UNTIL = _parse_utc(os.getenv("JWT_ACCEPT_HS256_UNTIL"))
+
+# Claves asimétricas (sólo si ALGORITHM=RS256, ver utils/jwks.py)
+keyring = KeyRing(algorithm=ALGORITHM) if ALGORITHM in ASYMMETRIC_ALGORITHMS else None
+EMPTY_JWKS = (b'{"keys": []}', '"empty"')
+_rotation_thread: Optional[KeyRotationThread] = None
+
+
+def init_signing_keys() -> None:
+    """Cargar (o generar) las claves de firma y arrancar su rotación periódica"""
+    global _rotation_thread
+    if keyring is None or _rotation_thread is not None:
+        return
+    if JWT_ACCEPT_HS256 and SECRET_KEY == DEFAULT_SECRET_KEY:
+        # Con la clave por defecto cualquiera podría firmar tokens HS256 válidos
+        raise RuntimeError(
+            "JWT_ACCEPT_HS256=true requiere un SECRET_KEY propio; "
+            "desactívalo o configura la clave usada para los tokens antiguos"
+        )
+    keyring.refresh()
+    _rotation_thread = KeyRotationThread(keyring)
+    _rotation_thread.start()
+
+
+def stop_signing_keys() -> None:
+    global _rotation_thread
+    if _rotation_thread is not None:
+        _rotation_thread.stop()
+        _rotation_thread = None
+
+
+def jwks_document() -> Tuple[bytes, str]:
+    """JWKS público (cuerpo JSON, ETag)"""
+    return keyring.jwks() if keyring is not None else EMPTY_JWKS
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -25,15 +75,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         to_encode["sub"] = str(to_encode["sub"])
 
     to_encode.update({"exp": expire})
+    if keyring is not None:
+        kid, key = keyring.signing_key()
+        return jwt.encode(to_encode, key, algorithm=ALGORITHM, headers={"kid": kid})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def _hs256_accepted() -> bool:
+    """¿Sigue abierta la transición de HS256 a RS256?"""
+    if not JWT_ACCEPT_HS256:
+        return False
+    return JWT_ACCEPT_HS256_UNTIL is None or datetime.utcnow() < JWT_ACCEPT_HS256_UNTIL
+
+
 def verify_token(token: str) -> Optional[dict]:
     """Verificar y decodificar token JWT"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        if keyring is None:
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        # La clave se elige por el alg/kid de la cabecera; cada clave sólo
+        # se usa con su propio algoritmo
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == ALGORITHM:
+            key = keyring.verification_key(header.get("kid"))
+            if key is None:
+                raise JWTError(f"kid desconocido: {header.get('kid')}")
+            return jwt.decode(token, key, algorithms=[ALGORITHM])
+        if header.get("alg") == "HS256" and _hs256_accepted():
+            return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        raise JWTError(f"Algoritmo no permitido: {header.get('alg')}")
     except JWTError as e:
         print(f"Error verificando token: {e}")  # Para debug
         return None
@@ -0,0 +1,419 @@
+"""Trazas ligeras por petición (controlador, SQL, bcrypt y SMTP).
+
+Los mismos puntos (traced() y las sentencias SQL) anotan, si la petición se
+está perfilando, qué hilos trabajan para ella en cada momento.
+
+- El middleware crea el span raíz de cada petición. Si llega una cabecera
+  W3C `traceparent` se reutiliza su trace id y su decisión de muestreo; si
+  no, se muestrea con probabilidad TRACE_SAMPLE_RATE (muestreo en cabecera).
+- Sin traza activa, start_span() devuelve un span vacío compartido: el coste
+  con el muestreo desactivado es una lectura de ContextVar.
+- Los spans terminados se exportan en lote desde un hilo a un fichero JSON
+  lines (TRACE_EXPORTER=file) o a un colector OTLP/HTTP JSON
+  (TRACE_EXPORTER=otlp).
+"""
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")  # file | otlp | none
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "tattoshop-auth")
+TRACE_MAX_QUEUE = 10000
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_SECONDS = 2.0
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class RequestThreads:
+    """Hilos que están ejecutando código de una petición (para el perfilado)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}  # ident -> bloques anidados en curso
+
+    def enter(self, ident: int) -> None:
+        with self._lock:
+            self._active[ident] = self._active.get(ident, 0) + 1
+
+    def exit(self, ident: int) -> None:
+        with self._lock:
+            if self._active.get(ident, 0) <= 1:
+                self._active.pop(ident, None)
+            else:
+                self._active[ident] -= 1
+
+    def snapshot(self) -> set:
+        with self._lock:
+            return set(self._active)
+
+
+# Sólo existe mientras se perfila la petición (ver utils/profiling.py)
+_request_threads: ContextVar[Optional[RequestThreads]] = ContextVar("request_threads", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class _NoopSpan:
+    """Span vacío para cuando la petición no se muestrea"""
+
+    __slots__ = ()
+    trace_id = None
+
+    def set_attribute(self, key, value) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "error", "_token",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, kind: int = 1):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind  # 1 = interno, 2 = servidor, 3 = cliente (OTLP)
+        self.start_ns = 0
+        self.end_ns = 0
+        self.attributes = {}
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def start(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        exporter.export(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: int = 1, **attributes):
+    """Span hijo del actual; vacío si la petición no se está trazando"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    span = Span(name, parent.trace_id, parent.span_id, kind)
+    if attributes:
+        span.attributes.update(attributes)
+    return span
+
+
+def traced(name: Optional[str] = None):
+    """Decorador que envuelve la función en un span"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            threads = _request_threads.get()
+            if threads is not None:
+                # Petición perfilada: este hilo trabaja para ella mientras dure
+                ident = threading.get_ident()
+                threads.enter(ident)
+                try:
+                    with start_span(span_name):
+                        return func(*args, **kwargs)
+                finally:
+                    threads.exit(ident)
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with start_span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def parse_traceparent(value: Optional[str]):
+    """Extraer (trace_id, parent_id, sampled) de una cabecera traceparent W3C"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class TracingMiddleware:
+    """Middleware ASGI que abre el span raíz de cada petición HTTP"""
+
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = None, None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        span = Span(
+            f"{scope['method']} {scope['path']}",
+            trace_id or _new_id(128),
+            parent_id,
+            kind=2,
+        )
+        span.set_attribute("http.method", scope["method"])
+        span.set_attribute("http.target", scope["path"])
+        traceparent = f"00-{span.trace_id}-{span.span_id}-01".encode()
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"traceparent", traceparent)],
+                }
+            await send(message)
+
+        span.start()
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Nombre con la plantilla de la ruta (/users/{user_id}) en lugar del path
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                span.name = f"{scope['method']} {_route_template(scope['path'], route.path)}"
+            span.end(error)
+
+
+def _route_template(path: str, route_path: str) -> str:
+    """Plantilla completa de la ruta, incluido el prefijo de los routers montados"""
+    segments = path.rstrip("/").split("/")
+    route_segments = route_path.strip("/").split("/")
+    prefix_length = len(segments) - len(route_segments)
+    if prefix_length <= 0:
+        return route_path
+    return "/".join(segments[:prefix_length]) + route_path
+
+
+def instrument_engine(engine) -> None:
+    """Crear un span por cada sentencia SQL ejecutada con el engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        threads = _request_threads.get()
+        if threads is not None:
+            threads.enter(threading.get_ident())
+            conn.info["profiled_threads"] = threads
+        span = start_span("db.query", kind=3)
+        if span is NOOP_SPAN:
+            return
+        span.set_attribute("db.system", engine.dialect.name)
+        span.set_attribute("db.statement", statement[:500])
+        conn.info.setdefault("trace_spans", []).append(span.start())
+
+    def _finish(conn, error=None):
+        threads = conn.info.pop("profiled_threads", None)
+        if threads is not None:
+            threads.exit(threading.get_ident())
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end(error)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _finish(conn)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            _finish(context.connection, context.original_exception)
+
+
+class SpanExporter:
+    """Exporta spans en lotes desde un hilo en segundo plano"""
+
+    def __init__(self, kind: str = TRACE_EXPORTER):
+        self.kind = kind
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=TRACE_MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.dropped = 0
+
+    def export(self, span: Span) -> None:
+        if self.kind == "none":
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="span-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._flush_batch(timeout=TRACE_FLUSH_SECONDS)
+
+    def _flush_batch(self, timeout: float = 0.0) -> None:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            while len(batch) < TRACE_BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+        try:
+            if self.kind == "otlp":
+                self._write_otlp(batch)
+            else:
+                self._write_file(batch)
+        except Exception as e:
+            print(f"Error exportando trazas: {e}")
+
+    def _write_file(self, batch) -> None:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for span in batch:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def _write_otlp(self, batch) -> None:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                typed = {"boolValue": value}
+            elif isinstance(value, int):
+                typed = {"intValue": str(value)}
+            elif isinstance(value, float):
+                typed = {"doubleValue": value}
+            else:
+                typed = {"stringValue": str(value)}
+            return {"key": key, "value": typed}
+
+        spans = []
+        for span in batch:
+            data = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                data["parentSpanId"] = span.parent_id
+            spans.append(data)
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [attribute("service.name", TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "app.utils.tracing"}, "spans": spans}],
+            }]
+        }
+        request = urllib.request.Request(
+            TRACE_OTLP_ENDPOINT,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+    def shutdown(self) -> None:
+        """Vaciar la cola pendiente y detener el hilo"""
+        self._stopped.set()
+        while not self._queue.empty():
+            self._flush_batch()
+
+
+# Exportador global
+exporter = SpanExporter()
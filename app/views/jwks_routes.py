@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Request, Response
+
+from ..utils.jwks import JWKS_MAX_AGE_SECONDS
+from ..utils.security import jwks_document
+
+# Claves públicas para que otros servicios verifiquen los tokens localmente
+router = APIRouter(tags=["jwks"])
+
+
+@router.get("/.well-known/jwks.json")
+def get_jwks(request: Request):
+    """Claves públicas de firma en formato JWKS (cacheables)"""
+    body, etag = jwks_document()
+    headers = {
+        "Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from ..models.database import get_db
 from ..controllers.usuario_controller import AuthController
@@ -15,33 +16,77 @@ from ..schemas.usuario_schema import (
     EmailConfirmation,
     ResendConfirmation,
     RegisterResponse,
+    BulkRoleUpdate,
+    BulkUserSelection,
+    BulkOperationResponse,
+    UserSearchItem,
+    UserSearchResponse,
+    UserStatsResponse,
+    TokenIntrospectionRequest,
+    TokenIntrospectionResponse,
+    UserBatchRequest,
+    UserBatchResponse,
 )
 from ..utils.auth_dependencies import (
-    get_current_active_user,
-    require_admin,
     require_admin_or_self,
+    require_change_own_password,
+    require_delete_users,
+    require_list_users,
+    require_manage_roles,
+    require_own_user,
+    require_service,
+    require_view_stats,
 )
+from ..utils.permissions import Permission, has_permission
+from ..utils.bulkhead import bulkhead, bulkheads
+from ..utils.deadline import request_budget
 from ..models.usuario import User
+from ..models.projections import WITH_CONFIRMATION
 
 # Crear router
 router = APIRouter(
     prefix="/auth",
     tags=["autenticacion"],
-    responses={401: {"description": "No autorizado"}},
+    responses={
+        401: {"description": "No autorizado"},
+        503: {"description": "Servicio saturado"},
+    },
 )
 
+# Compartimentos de concurrencia por tipo de ruta
+HASHING = [Depends(bulkhead("hashing"))]
+DB_READ = [Depends(bulkhead("db_read"))]
+DB_WRITE = [Depends(bulkhead("db_write"))]
+EMAIL = [Depends(bulkhead("email"))]
+
+# Plazos por ruta (el resto usa REQUEST_TIMEOUT_SECONDS)
+LOGIN_BUDGET = Depends(request_budget(5))
+BULK_BUDGET = Depends(request_budget(60))
+
 
 @router.post(
-    "/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED
+    "/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED,
 )
-def register_user(
+async def register_user(
     user: UserCreate,
     db: Session = Depends(get_db),
     # current_user: User = Depends(require_admin)  # Comentado para permitir registro libre
 ):
     """Crear un nuevo usuario y enviar email de confirmación"""
     controller = AuthController(db)
-    new_user = controller.create_user(user)
+    # Cada fase ocupa sólo su compartimento: un SMTP lento no retiene los
+    # huecos de hashing que necesitan /login y /change-password
+    async with bulkheads["hashing"].slot():
+        new_user = await run_in_threadpool(controller.create_user, user, False)
+    try:
+        async with bulkheads["email"].slot():
+            await run_in_threadpool(controller.send_registration_email, new_user)
+    except HTTPException as e:
+        if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+            raise
+        # Compartimento de email saturado: el usuario ya existe y puede
+        # pedir el reenvío con /resend-confirmation
+        print(f"Email de confirmación no enviado a {new_user.email}: compartimento saturado")
     return RegisterResponse(
         message="Usuario registrado exitosamente. Revisa tu email para confirmar tu cuenta.",
         user=new_user,
@@ -49,7 +94,7 @@ def register_user(
     )
 
 
-@router.post("/confirm-email", response_model=UserResponse)
+@router.post("/confirm-email", response_model=UserResponse, dependencies=DB_WRITE)
 def confirm_email(confirmation_data: EmailConfirmation, db: Session = Depends(get_db)):
     """Confirmar email del usuario con token alfanumérico"""
     controller = AuthController(db)
@@ -57,7 +102,7 @@ def confirm_email(confirmation_data: EmailConfirmation, db: Session = Depends(ge
     return confirmed_user
 
 
-@router.post("/resend-confirmation")
+@router.post("/resend-confirmation", dependencies=EMAIL)
 def resend_confirmation_email(
     resend_data: ResendConfirmation, db: Session = Depends(get_db)
 ):
@@ -77,7 +122,9 @@ def resend_confirmation_email(
         )
 
 
-@router.post("/login", response_model=LoginResponse)
+@router.post(
+    "/login", response_model=LoginResponse, dependencies=[LOGIN_BUDGET, *HASHING]
+)
 def login(login_data: UserLogin, db: Session = Depends(get_db)):
     """Iniciar sesión y obtener token (requiere email confirmado)"""
     controller = AuthController(db)
@@ -88,17 +135,34 @@ def login(login_data: UserLogin, db: Session = Depends(get_db)):
     )
 
 
-@router.get("/profile", response_model=UserResponse)
-def get_my_profile(current_user: User = Depends(get_current_active_user)):
+@router.post(
+    "/introspect", response_model=TokenIntrospectionResponse, dependencies=DB_READ
+)
+def introspect_tokens(
+    request_data: TokenIntrospectionRequest,
+    db: Session = Depends(get_db),
+    service: str = Depends(require_service),
+):
+    """Verificar varios tokens a la vez (solo servicios internos)"""
+    controller = AuthController(db)
+    return TokenIntrospectionResponse(
+        results=controller.introspect_tokens(request_data.tokens)
+    )
+
+
+@router.get("/profile", response_model=UserResponse, dependencies=DB_READ)
+def get_my_profile(
+    current_user: User = Depends(require_own_user),
+):
     """Obtener mi perfil actual"""
     return current_user
 
 
-@router.get("/profile/{user_id}", response_model=UserResponse)
+@router.get("/profile/{user_id}", response_model=UserResponse, dependencies=DB_READ)
 def get_user_profile(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin_or_self(id)),
+    current_user: User = Depends(require_admin_or_self),
 ):
     """Obtener perfil de usuario (solo admins o el mismo usuario)"""
     controller = AuthController(db)
@@ -106,11 +170,11 @@ def get_user_profile(
     return user
 
 
-@router.patch("/change-password", response_model=UserResponse)
+@router.patch("/change-password", response_model=UserResponse, dependencies=HASHING)
 def change_my_password(
     password_data: PasswordUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user),
+    current_user: User = Depends(require_change_own_password),
 ):
     """Cambiar mi contraseña"""
     controller = AuthController(db)
@@ -118,13 +182,13 @@ def change_my_password(
     return updated_user
 
 
-@router.get("/users", response_model=List[UserListItem])
+@router.get("/users", response_model=List[UserListItem], dependencies=DB_READ)
 def list_users(
     skip: int = Query(0, ge=0, description="Registros a omitir"),
     limit: int = Query(100, ge=1, le=1000, description="Límite de registros"),
     role: Optional[str] = Query(None, description="Filtrar por rol (admin, client, artist)"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin),  # Solo admins pueden listar usuarios
+    current_user: User = Depends(require_list_users),
 ):
     """Listar todos los usuarios (solo admins)"""
     controller = AuthController(db)
@@ -132,11 +196,108 @@ def list_users(
     return users
 
 
-@router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.get("/users/stats", response_model=UserStatsResponse, dependencies=DB_READ)
+def get_user_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_view_stats),
+):
+    """Estadísticas de usuarios por rol, confirmación y fecha (solo admins)"""
+    controller = AuthController(db)
+    return controller.get_user_stats()
+
+
+@router.get("/users/search", response_model=UserSearchResponse, dependencies=DB_READ)
+def search_users(
+    q: str = Query(..., min_length=2, max_length=100, description="Nombre, apellido o prefijo de email"),
+    limit: int = Query(20, ge=1, le=50, description="Resultados por página"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_list_users),
+):
+    """Buscar usuarios por nombre, apellido o email (solo admins)"""
+    controller = AuthController(db)
+    results, next_cursor = controller.search_users(q, limit=limit, cursor=cursor)
+    return UserSearchResponse(
+        users=[
+            UserSearchItem(
+                id=user.id,
+                name=user.name,
+                last_name=user.last_name,
+                email=user.email,
+                role=user.role.value,
+                email_confirmed=user.email_confirmed,
+                created_at=user.created_at,
+                last_login=user.last_login,
+                last_seen_at=user.last_seen_at,
+                score=score,
+            )
+            for user, score in results
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.post("/users/batch", response_model=UserBatchResponse, dependencies=DB_READ)
+def get_users_batch(
+    batch_data: UserBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_own_user),
+):
+    """Obtener varios perfiles por ID (solo admins o el mismo usuario)"""
+    # Mismas reglas que /profile/{user_id}, aplicadas a cada ID
+    if not has_permission(current_user.role, Permission.READ_ANY_USER) and any(
+        user_id != current_user.id for user_id in batch_data.user_ids
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo puedes acceder a tu propia información o ser administrador",
+        )
+
+    controller = AuthController(db)
+    return controller.get_users_by_ids(batch_data.user_ids, batch_data.fields)
+
+
+@router.patch(
+    "/users/bulk-role",
+    response_model=BulkOperationResponse,
+    dependencies=[BULK_BUDGET, *DB_WRITE],
+)
+def bulk_change_user_role(
+    bulk_data: BulkRoleUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_manage_roles),
+):
+    """Cambiar el rol de varios usuarios por IDs o filtro (solo admins)"""
+    controller = AuthController(db)
+    outcome = controller.bulk_update_role(
+        bulk_data, bulk_data.new_role, current_user.id
+    )
+    return BulkOperationResponse(**outcome)
+
+
+@router.post(
+    "/users/bulk-delete",
+    response_model=BulkOperationResponse,
+    dependencies=[BULK_BUDGET, *DB_WRITE],
+)
+def bulk_delete_users(
+    selection: BulkUserSelection,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_delete_users),
+):
+    """Eliminar varios usuarios por IDs o filtro (solo admins)"""
+    controller = AuthController(db)
+    outcome = controller.bulk_delete_users(selection, current_user.id)
+    return BulkOperationResponse(**outcome)
+
+
+@router.delete(
+    "/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=DB_WRITE
+)
 def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin),
+    current_user: User = Depends(require_delete_users),
 ):
     """Eliminar usuario permanentemente (solo admins)"""
     if user_id == current_user.id:
@@ -150,8 +311,10 @@ def delete_user(
     return None
 
 
-@router.get("/check-role")
-def check_my_role(current_user: User = Depends(get_current_active_user)):
+@router.get("/check-role", dependencies=DB_READ)
+def check_my_role(
+    current_user: User = Depends(require_own_user),
+):
     """Verificar mi rol actual"""
     return {
         "user_id": current_user.id,
@@ -163,15 +326,15 @@ def check_my_role(current_user: User = Depends(get_current_active_user)):
     }
 
 
-@router.get("/confirmation-status/{user_id}")
+@router.get("/confirmation-status/{user_id}", dependencies=DB_READ)
 def get_confirmation_status(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin_or_self(id)),
+    current_user: User = Depends(require_admin_or_self),
 ):
     """Verificar estado de confirmación de email"""
     controller = AuthController(db)
-    user = controller.get_user_profile(user_id)
+    user = controller.get_user_profile(user_id, WITH_CONFIRMATION)
 
     return {
         "user_id": user.id,
@@ -185,12 +348,12 @@ def get_confirmation_status(
 
 
 # Nueva ruta para cambiar rol (solo admins)
-@router.patch("/users/{user_id}/role")
+@router.patch("/users/{user_id}/role", dependencies=DB_WRITE)
 def change_user_role(
     user_id: int,
     new_role: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_admin),
+    current_user: User = Depends(require_manage_roles),
 ):
     """Cambiar rol de usuario (solo admins)"""
     if new_role not in ["admin", "client", "artist"]:
@@ -206,14 +369,8 @@ def change_user_role(
         )
 
     controller = AuthController(db)
-    user = controller.get_user_profile(user_id)
-    
-    # Actualizar rol
-    from ..models.usuario import UserRole
-    user.role = UserRole(new_role)
-    db.commit()
-    db.refresh(user)
-    
+    user = controller.change_user_role(user_id, new_role)
+
     return {
         "message": f"Rol actualizado a {new_role}",
         "user_id": user.id,
@@ -0,0 +1,111 @@
+"""Comparar carga de filas completas frente a la proyección por schema.
+
+Uso:
+    python benchmarks/bench_projection.py --rows 20000 --repeat 5
+
+Usa SQLite en memoria salvo que se indique otra DATABASE_URL. Mide el tamaño
+medio de fila transferido y el tiempo de hidratación de objetos User con todas
+las columnas (incluidas las diferidas) y con sólo las columnas de
+UserListItem / UserResponse.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("DB_ECHO", "false")
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app.models.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.usuario import User, UserRole  # noqa: E402
+from app.models.projections import (  # noqa: E402
+    WITH_CONFIRMATION,
+    WITH_CREDENTIALS,
+    columns_for,
+    project,
+)
+from app.schemas.usuario_schema import UserListItem, UserResponse  # noqa: E402
+
+FAKE_HASH = "$2b$12$" + "x" * 53
+
+
+def seed(engine, rows: int) -> None:
+    now = datetime.utcnow()
+    roles = list(UserRole)
+    data = [
+        {
+            "name": f"Nombre{i}",
+            "last_name": f"Apellido{i}",
+            "email": f"user{i}@example.com",
+            "email_confirmed": i % 3 != 0,
+            "password": FAKE_HASH,
+            "role": roles[i % len(roles)],
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now,
+            "confirmation_token": "ABC123",
+            "confirmation_sent_at": now,
+            "token_expires_at": now + timedelta(hours=24),
+        }
+        for i in range(rows)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), data)
+
+
+def row_size(engine, columns) -> float:
+    """Bytes medios por fila (representación textual de los valores)"""
+    with engine.connect() as conn:
+        rows = conn.execute(select(*columns)).all()
+    total = sum(len(str(value)) for row in rows for value in row if value is not None)
+    return total / max(1, len(rows))
+
+
+def time_hydration(Session, options, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        db = Session()
+        started = time.perf_counter()
+        db.query(User).options(*options).all()
+        timings.append(time.perf_counter() - started)
+        db.close()
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows)
+
+    full_columns = [column for column in User.__table__.columns]
+    cases = [
+        ("fila completa", full_columns, (WITH_CREDENTIALS, WITH_CONFIRMATION)),
+        ("UserResponse", columns_for(UserResponse), (project(UserResponse),)),
+        ("UserListItem", columns_for(UserListItem), (project(UserListItem),)),
+    ]
+
+    baseline_size = baseline_time = None
+    print(f"{'caso':<15} {'bytes/fila':>11} {'ms hidratación':>15} {'ahorro':>8}")
+    for name, columns, options in cases:
+        size = row_size(engine, columns)
+        elapsed = time_hydration(SessionLocal, options, args.repeat)
+        if baseline_size is None:
+            baseline_size, baseline_time = size, elapsed
+        saving = 1 - elapsed / baseline_time
+        print(
+            f"{name:<15} {size:>11.1f} {elapsed * 1000:>15.1f} {saving:>7.0%}"
+            f"   (tamaño -{1 - size / baseline_size:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Coste de la autorización por petición: dependencias antiguas frente a RBAC.
+
+Uso:
+    python benchmarks/bench_rbac.py --iterations 200000
+
+Compara, sin red ni DB, el trabajo que hace cada petición para autorizar:
+- antes: comparar enums y buscar en listas (require_admin_or_self recibía
+  el builtin `id`, así que la comprobación de dueño nunca coincidía; aquí se
+  mide con el id correcto);
+- ahora: una búsqueda en la tabla de máscaras y un AND (más, para el
+  dueño, convertir el parámetro de ruta a int).
+El cambio a RBAC corrige la comprobación de dueño y centraliza la política;
+no es una optimización: el camino del dueño es más lento que antes y el de
+admin queda del mismo orden (varía entre ejecuciones, a veces más lento).
+Las dependencias se crean al importar auth_dependencies, como en las rutas.
+"""
+import argparse
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("DB_ECHO", "false")
+
+from fastapi import HTTPException  # noqa: E402
+
+from app.models.usuario import UserRole  # noqa: E402
+from app.utils.auth_dependencies import (  # noqa: E402
+    require_admin_or_self,
+    require_list_users,
+)
+
+
+# Implementación anterior (copiada de auth_dependencies.py)
+def legacy_require_admin_or_self(user_id: int):
+    def admin_or_self_checker(current_user):
+        if current_user.role != UserRole.ADMIN and current_user.id != user_id:
+            raise HTTPException(status_code=403)
+        return current_user
+
+    return admin_or_self_checker
+
+
+def legacy_require_admin_or_artist(current_user):
+    if current_user.role not in [UserRole.ADMIN, UserRole.ARTIST]:
+        raise HTTPException(status_code=403)
+    return current_user
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    client = SimpleNamespace(id=7, role=UserRole.CLIENT)
+    admin = SimpleNamespace(id=1, role=UserRole.ADMIN)
+    request = SimpleNamespace(path_params={"user_id": "7"})
+
+    # Igual que FastAPI: las dependencias se crean una vez al declarar la ruta
+    legacy_owner = legacy_require_admin_or_self(7)
+    rbac_owner = require_admin_or_self
+    rbac_list = require_list_users
+
+    def legacy_self():
+        legacy_owner(client)
+
+    def legacy_admin():
+        legacy_owner(admin)
+        legacy_require_admin_or_artist(admin)
+
+    def rbac_self():
+        rbac_owner(request, client)
+
+    def rbac_admin():
+        rbac_owner(request, admin)
+        rbac_list(request, admin)
+
+    cases = [
+        ("antes: dueño", legacy_self),
+        ("RBAC: dueño", rbac_self),
+        ("antes: admin (2 checks)", legacy_admin),
+        ("RBAC: admin (2 checks)", rbac_admin),
+    ]
+    print(f"{'caso':<26} {'ns/petición':>12}")
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=n, repeat=5))
+        print(f"{name:<26} {best / n * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Contar idas y vueltas a la DB (sentencias + COMMIT) por endpoint.
+
+Uso:
+    python benchmarks/bench_roundtrips.py
+
+Ejecuta los métodos de AuthController sobre SQLite en memoria, con y sin
+RETURNING (el segundo caso reproduce el camino que sigue MySQL), y muestra
+cuántas sentencias y commits emite cada uno. El envío de emails se sustituye
+por un stub para no salir a la red.
+
+Antes de este cambio (mismo cálculo, sólo el trabajo del controlador):
+    register           6  (SELECT email, INSERT, COMMIT, refresh, UPDATE token, COMMIT)
+    confirm-email      4  (SELECT, UPDATE, COMMIT, refresh)
+    login              2  (SELECT, COMMIT vacío)
+    change-password    4  (SELECT, UPDATE, COMMIT, refresh)
+    users/{id}/role    4  (SELECT, UPDATE, COMMIT, refresh)
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["DB_ECHO"] = "false"
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.models.database import Base, build_engine  # noqa: E402
+from app.controllers.usuario_controller import AuthController  # noqa: E402
+from app.schemas.usuario_schema import (  # noqa: E402
+    EmailConfirmation,
+    PasswordUpdate,
+    UserCreate,
+    UserLogin,
+)
+
+
+class StubEmailService:
+    def send_confirmation_email(self, *args) -> bool:
+        return True
+
+    def send_welcome_email(self, *args) -> bool:
+        return True
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def reset(self) -> None:
+        self.statements = self.commits = 0
+
+
+def run(use_returning: bool) -> None:
+    engine = build_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    engine.dialect.update_returning = use_returning
+    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    counter = RoundTripCounter(engine)
+
+    def measure(name, action):
+        db = Session()
+        controller = AuthController(db)
+        controller.email_service = StubEmailService()
+        counter.reset()
+        result = action(controller)
+        total = counter.statements + counter.commits
+        print(
+            f"  {name:<18} {total:>2}  ({counter.statements} sentencias, {counter.commits} commits)"
+        )
+        db.close()
+        return result
+
+    label = "con RETURNING (SQLite)" if use_returning else "sin RETURNING (MySQL)"
+    print(label)
+
+    user = measure(
+        "register",
+        lambda c: c.create_user(
+            UserCreate(
+                name="Ana", last_name="Pérez", email="ana@example.com",
+                password="secreto123", role="client",
+            )
+        ),
+    )
+    measure(
+        "confirm-email",
+        lambda c: c.confirm_email(EmailConfirmation(token=user.confirmation_token)),
+    )
+    measure(
+        "login",
+        lambda c: c.authenticate_user(
+            UserLogin(email="ana@example.com", password="secreto123")
+        ),
+    )
+    measure(
+        "change-password",
+        lambda c: c.update_password(
+            user.id,
+            PasswordUpdate(current_password="secreto123", new_password="otro12345"),
+        ),
+    )
+    measure("users/{id}/role", lambda c: c.change_user_role(user.id, "artist"))
+    print()
+
+
+if __name__ == "__main__":
+    run(use_returning=True)
+    run(use_returning=False)
@@ -0,0 +1,111 @@
+"""Comparar peticiones por segundo con 1, 2 y N workers.
+
+Uso (desde la raíz del repo, con la DB configurada en .env):
+    python benchmarks/bench_workers.py --path / --duration 10 --concurrency 64
+
+Levanta `python -m app.server` con cada número de workers, lanza carga con
+conexiones keep-alive desde hilos y muestra las peticiones/s obtenidas.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.server import available_cpus  # noqa: E402
+
+
+def wait_until_ready(port: int, path: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+def run_load(port: int, path: str, concurrency: int, duration: float) -> tuple[int, int]:
+    stop_at = time.monotonic() + duration
+    counts = [0] * concurrency
+    errors = [0] * concurrency
+
+    def worker(i: int) -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        while time.monotonic() < stop_at:
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status < 500:
+                    counts[i] += 1
+                else:
+                    errors[i] += 1
+            except (OSError, http.client.HTTPException):
+                errors[i] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts), sum(errors)
+
+
+def bench(workers: int, args) -> float:
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "app.server",
+            "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(workers),
+        ],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(args.port, args.path)
+        run_load(args.port, args.path, args.concurrency, 2)  # Calentamiento
+        ok, errors = run_load(args.port, args.path, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=args.duration + 30)
+
+    rps = ok / args.duration
+    print(f"workers={workers:<3} req/s={rps:10.1f}  ok={ok}  errores={errors}")
+    return rps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    cores = available_cpus()
+    results = {}
+    for workers in sorted({1, 2, cores}):
+        results[workers] = bench(workers, args)
+
+    base = results[1] or 1.0
+    print("\nAceleración respecto a 1 worker:")
+    for workers, rps in results.items():
+        print(f"  {workers:>3} workers: x{rps / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()